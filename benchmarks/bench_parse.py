@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Micro benchmark of parsing one evstats packet.
+
+Compares EVCar.from_json against the previous implementation (decode to
+str, json.loads, eager debug formatting). Run from the top of the tree:
+
+    python -m benchmarks.bench_parse
+"""
+
+import json
+import logging
+import timeit
+
+from mychevy.mychevy import CAR_ATTRS, EVCar, _json_loads
+from tests.test_mychevy import CAR1, PKT1
+
+_LOGGER = logging.getLogger("bench")
+
+NUMBER = 100000
+
+
+def legacy_from_json(car, data):
+    res = json.loads(data.decode("utf-8"))
+    d = res["data"]
+    car.plugged_in = d["plugState"] == "plugged"
+    _LOGGER.debug("Data: {}".format(d))
+    for a in CAR_ATTRS:
+        if a in d:
+            setattr(car, a, d[a])
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    car = EVCar(CAR1)
+
+    print("json backend: %s" % _json_loads.__module__)
+    results = {}
+    for name, func in (("legacy", legacy_from_json),
+                       ("from_json", EVCar.from_json)):
+        best = min(timeit.repeat(lambda: func(car, PKT1),
+                                 number=NUMBER, repeat=5))
+        results[name] = best / NUMBER * 1e6
+        print("%-10s %6.2f us/packet" % (name, results[name]))
+
+    print("speedup    %6.2fx" % (results["legacy"] / results["from_json"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""End to end benchmark of login and refresh against the fake GM server.
+
+Reports throughput and p50/p99 latency for logging in, and for
+refreshing one account and many accounts. Run from the top of the tree:
+
+    python -m benchmarks.bench_refresh --accounts 20 --vehicles 3
+"""
+
+import argparse
+import statistics
+import time
+
+from mychevy.fleet import Fleet
+from mychevy.mychevy import MyChevy
+from mychevy.retry import RetryPolicy
+from tests.fakegm import FakeGM
+
+
+def percentiles(samples):
+    if len(samples) < 2:
+        return samples[0], samples[0]
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return cuts[49], cuts[98]
+
+
+def report(name, count, elapsed, samples):
+    p50, p99 = percentiles(samples)
+    print("%-28s %6d ops %8.1f ops/s  p50 %7.1f ms  p99 %7.1f ms"
+          % (name, count, count / elapsed, p50 * 1000, p99 * 1000))
+
+
+def timed_fetches(page):
+    """Wrap page._fetch_car to record how long each fetch takes."""
+    samples = []
+    fetch = page._fetch_car
+
+    def timed(car):
+        start = time.perf_counter()
+        try:
+            return fetch(car)
+        finally:
+            samples.append(time.perf_counter() - start)
+
+    page._fetch_car = timed
+    return samples
+
+
+def bench_single(gm, rounds, workers):
+    page = MyChevy("single@example.com", "secret", urls=gm.urls,
+                   retry_policy=RetryPolicy(delay=0.1))
+    start = time.perf_counter()
+    page.login()
+    page.get_cars()
+    elapsed = time.perf_counter() - start
+    report("login + get_cars", 1, elapsed, [elapsed])
+
+    samples = timed_fetches(page)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        page.update_cars()
+    report("update_cars (serial)", len(samples),
+           time.perf_counter() - start, samples)
+
+    samples[:] = []
+    start = time.perf_counter()
+    for _ in range(rounds):
+        page.update_cars_concurrently(max_workers=workers)
+    report("update_cars_concurrently", len(samples),
+           time.perf_counter() - start, samples)
+
+
+def bench_fleet(gm, accounts, rounds, workers):
+    fleet = Fleet(max_workers=workers)
+    all_samples = []
+    for n in range(accounts):
+        page = fleet.add_account("user%d@example.com" % n, "secret")
+        page.urls = gm.urls
+        page.retry_policy = RetryPolicy(delay=0.1)
+        all_samples.append(timed_fetches(page))
+
+    try:
+        start = time.perf_counter()
+        results = fleet.refresh_all()
+        samples = [s for account in all_samples for s in account]
+        report("fleet first refresh (login)", len(results),
+               time.perf_counter() - start, samples)
+
+        for account in all_samples:
+            account[:] = []
+        start = time.perf_counter()
+        count = 0
+        for _ in range(rounds):
+            count += len(fleet.refresh_all())
+        samples = [s for account in all_samples for s in account]
+        report("fleet refresh_all", count, time.perf_counter() - start,
+               samples)
+    finally:
+        fleet.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=20)
+    parser.add_argument("--vehicles", type=int, default=3)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="seconds of latency per fake request")
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--server-error-rate", type=float, default=0)
+    args = parser.parse_args()
+
+    with FakeGM(vehicles=args.vehicles, latency=args.latency,
+                error_rate=args.error_rate,
+                server_error_rate=args.server_error_rate) as gm:
+        bench_single(gm, args.rounds, args.workers)
+        bench_fleet(gm, args.accounts, args.rounds, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""CPU and allocation profile of the client, replayed from a cassette.
+
+Replays a recorded login + get_cars + update_cars with no network and
+no latency, so only the client's own cost is measured. A cassette of a
+real session is replayed against the real urls of --country. Without
+one, a session is recorded from the fake GM server first. Run from the
+top of the tree:
+
+    python -m benchmarks.bench_replay --rounds 200 [session.json.gz]
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from mychevy.cassette import Cassette, RecordingAdapter, ReplayAdapter
+from mychevy.mychevy import URLS, MyChevy
+from tests.fakegm import FakeGM
+
+
+def session(page):
+    page.login()
+    page.get_cars()
+    page.update_cars()
+
+
+def record(vehicles):
+    """Record a session against the fake server, returns (urls, cassette)."""
+    cassette = Cassette()
+    with FakeGM(vehicles=vehicles) as gm:
+        adapter = RecordingAdapter(cassette, ["bench@example.com", "secret"])
+        page = MyChevy("bench@example.com", "secret", urls=gm.urls,
+                       adapter=adapter)
+        session(page)
+        return gm.urls, cassette
+
+
+def replay(urls, cassette, rounds):
+    adapter = ReplayAdapter(cassette)
+    start = time.process_time()
+    for _ in range(rounds):
+        adapter.rewind()
+        session(MyChevy("user", "passwd", urls=urls, adapter=adapter))
+    return (time.process_time() - start) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("cassette", nargs="?")
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--vehicles", type=int, default=3,
+                        help="vehicles to record when there's no cassette")
+    parser.add_argument("--country", default="us")
+    args = parser.parse_args()
+
+    if args.cassette:
+        urls, cassette = URLS[args.country], Cassette.load(args.cassette)
+    else:
+        urls, cassette = record(args.vehicles)
+
+    # warm up, then time without tracing overhead
+    replay(urls, cassette, 1)
+    cpu = replay(urls, cassette, args.rounds)
+
+    tracemalloc.start()
+    replay(urls, cassette, 1)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print("%d requests per session" % len(cassette))
+    print("cpu per session      %8.2f ms" % (cpu * 1000))
+    print("allocated (peak)     %8.1f KiB" % (peak / 1024))
+    print("retained             %8.1f KiB" % (current / 1024))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+# Copyright 2017 Sean Dague
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Asyncio client, mirrors MyChevy on top of aiohttp."""
+
+import asyncio
+from functools import wraps
+import json
+import logging
+import time
+import urllib
+
+import aiohttp
+
+from mychevy.mychevy import (
+    EVCar,
+    KEY,
+    MAX_WORKERS,
+    ServerError,
+    TIMEOUT,
+    URLS,
+    USER_AGENT,
+    id_token_re,
+    parse_account,
+    settings_json_re,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def async_retry(exceptions, tries=3, delay=3, backoff=2, logger=None):
+    """
+    Retry awaiting the decorated coroutine using an exponential backoff.
+
+    Same semantics as mychevy.mychevy.retry, but waits with asyncio.sleep
+    so other tasks on the event loop keep running between attempts.
+    """
+
+    def deco_retry(f):
+        @wraps(f)
+        async def f_retry(*args, **kwargs):
+            mtries, mdelay = tries, delay
+            while mtries > 1:
+                try:
+                    return await f(*args, **kwargs)
+                except exceptions as e:
+                    msg = "{}, Retrying in {} seconds...".format(e, mdelay)
+                    if logger:
+                        logger.warning(msg)
+                    else:
+                        print(msg)
+                    await asyncio.sleep(mdelay)
+                    mtries -= 1
+                    mdelay *= backoff
+            return await f(*args, **kwargs)
+
+        return f_retry  # true decorator
+
+    return deco_retry
+
+
+class AsyncMyChevy(object):
+    """Asyncio version of MyChevy.
+
+    Each account gets its own aiohttp session (and so its own cookie
+    jar). Pass a shared ``connector`` to pool connections across many
+    accounts on one event loop.
+    """
+
+    def __init__(self, user, passwd, country="us", connector=None, urls=None):
+        super(AsyncMyChevy, self).__init__()
+
+        self.user = user
+        self.passwd = passwd
+        self.cars = []
+        self.session = None
+        self.account = None
+        self.country = country
+        self.urls = urls or URLS[country]
+        self.connector = connector
+        # callbacks given to every car, see MyChevy.subscribe
+        self.subscribers = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def login(self):
+        """Same login flow as MyChevy.login, without blocking the loop."""
+        await self.close()
+        self.session = aiohttp.ClientSession(
+            connector=self.connector,
+            connector_owner=self.connector is None,
+            cookie_jar=aiohttp.CookieJar(unsafe=True),
+            timeout=aiohttp.ClientTimeout(total=TIMEOUT),
+        )
+
+        # It doesn't like an empty session so load the login page first.
+        async with self.session.get(self.urls["home"]) as r:
+            text = await r.text()
+            initial_url = urllib.parse.urlparse(str(r.url))
+        nonce = urllib.parse.parse_qs(initial_url.query).get("nonce")[0]
+
+        _LOGGER.debug("Initial URL %s, Nonce %s", initial_url, nonce)
+        m = settings_json_re.search(text)
+        if not m:
+            raise ValueError("SETTINGS not found in response")
+
+        settings_json = json.loads(m[1])
+        csrf = settings_json["csrf"]
+        trans_id = settings_json["transId"]
+
+        _LOGGER.debug(
+            "Settings %s, CSRF %s, Trans_id %s", settings_json, csrf, trans_id
+        )
+
+        # Login Request
+        async with self.session.post(
+            self.urls["self_asserted"].format(trans_id),
+            data={
+                "request_type": "RESPONSE",
+                "logonIdentifier": self.user,
+                "password": self.passwd,
+            },
+            headers={
+                "X-CSRF-TOKEN": csrf,
+            },
+        ) as r:
+            await r.read()
+
+        # Generate Auth Code and ID Token
+        token_url = self.urls["token"].format(csrf, trans_id)
+        async with self.session.get(token_url) as r:
+            r.raise_for_status()
+            text = await r.text()
+        _LOGGER.debug("ID Token Content: %s", text)
+        m = id_token_re.search(text)
+        if not m:
+            raise ValueError("id_token not found in response")
+
+        id_token = m.group(1)
+
+        # Post ID Token
+        async with self.session.post(
+            self.urls["oc_login"], data={"id_token": id_token}
+        ) as r:
+            r.raise_for_status()
+            await r.read()
+
+        async with self.session.get(self.urls["loginSuccessData"]) as r:
+            self.account = parse_account(await r.read())
+
+    async def get_cars(self):
+        if self.account is None:
+            raise ValueError("Not logged in, call login() first")
+
+        self.cars = []
+        _LOGGER.debug("Vehicles: %s", self.account.vehicles)
+        for vehicle in self.account.vehicles:
+            car = EVCar(vehicle)
+            for callback in self.subscribers:
+                car.subscribe(callback)
+            self.cars.append(car)
+
+    def subscribe(self, callback):
+        """Subscribe callback to changes of every car, see EVCar.subscribe."""
+        self.subscribers.append(callback)
+        for car in self.cars:
+            car.subscribe(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+        for car in self.cars:
+            car.unsubscribe(callback)
+
+    async def changes(self):
+        """Async iterator of CarChange events for every car.
+
+        Refreshes run on the event loop, so events are queued without
+        any locking. Stops when the iterator is closed.
+        """
+        queue = asyncio.Queue()
+        self.subscribe(queue.put_nowait)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self.unsubscribe(queue.put_nowait)
+
+    @async_retry(ServerError, logger=_LOGGER)
+    async def _fetch_car(self, car):
+        headers = {"user-agent": USER_AGENT}
+        _LOGGER.debug("Fetching car...")
+        now = int(round(time.time() * 1000))
+        session = self.urls["session"].format(car.vin, car.onstar, now, KEY)
+        async with self.session.get(
+            session, headers=headers, allow_redirects=False
+        ) as res:
+            await res.read()
+
+        now = int(round(time.time() * 1000))
+        url = self.urls["evstats"].format(car.vin, car.onstar, now, KEY)
+        async with self.session.get(
+            url, headers=headers, allow_redirects=False
+        ) as res:
+            content = await res.read()
+
+        _LOGGER.debug("Vehicle data: %s", content)
+        car.from_json(content)
+
+    async def update_cars(self):
+        for c in self.cars:
+            await self._fetch_car(c)
+        return self.cars
+
+    async def update_cars_concurrently(self, max_workers=MAX_WORKERS):
+        """Refresh all cars concurrently, at most max_workers at a time.
+
+        Returns a dict of vin -> exception for every car that could not
+        be updated.
+        """
+        sem = asyncio.Semaphore(max(1, max_workers))
+
+        async def fetch(car):
+            async with sem:
+                await self._fetch_car(car)
+
+        results = await asyncio.gather(
+            *(fetch(c) for c in self.cars), return_exceptions=True
+        )
+        errors = {}
+        for car, res in zip(self.cars, results):
+            if isinstance(res, Exception):
+                _LOGGER.warning("Failed to update %s: %s", car.vin, res)
+                errors[car.vin] = res
+        return errors
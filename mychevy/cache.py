@@ -0,0 +1,126 @@
+# Copyright 2017 Sean Dague
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""On disk cache of logged in sessions."""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+# How long we trust a saved session before doing a full login anyway.
+SESSION_MAX_AGE = 12 * 60 * 60
+
+
+def dump_cookies(jar):
+    """Turn a cookie jar into a list of json serializable dicts."""
+    return [
+        {
+            "name": c.name,
+            "value": c.value,
+            "domain": c.domain,
+            "path": c.path,
+            "secure": c.secure,
+            "expires": c.expires,
+        }
+        for c in jar
+    ]
+
+
+def load_cookies(jar, cookies):
+    """Load cookies produced by dump_cookies back into a cookie jar."""
+    for c in cookies:
+        jar.set(
+            c["name"],
+            c["value"],
+            domain=c["domain"],
+            path=c["path"],
+            secure=c["secure"],
+            expires=c["expires"],
+        )
+
+
+class SessionStore(object):
+    """Saved session cookies, keyed by user and country.
+
+    The file contains live session cookies, so it is created readable
+    by the owner only. Users are stored hashed so the file doesn't leak
+    account emails.
+    """
+
+    def __init__(self, path, max_age=SESSION_MAX_AGE):
+        super(SessionStore, self).__init__()
+        self.path = os.path.expanduser(path)
+        self.max_age = max_age
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(user, country):
+        key = "{0}:{1}".format(country, user.lower())
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError):
+            _LOGGER.warning("Ignoring unreadable session cache %s", self.path)
+            return {}
+
+    def _write(self, data):
+        dirname = os.path.dirname(self.path) or "."
+        fd, tmp = tempfile.mkstemp(dir=dirname, prefix=".mychevy-")
+        try:
+            os.chmod(tmp, 0o600)
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+        except Exception:
+            os.unlink(tmp)
+            raise
+
+    def load(self, user, country):
+        """Return the saved entry for an account, or None if stale."""
+        with self._lock:
+            entry = self._read().get(self._key(user, country))
+        if not entry:
+            return None
+        if entry["expires"] < time.time():
+            _LOGGER.debug("Cached session expired")
+            return None
+        return entry
+
+    def save(self, user, country, jar):
+        now = time.time()
+        with self._lock:
+            data = self._read()
+            data[self._key(user, country)] = {
+                "cookies": dump_cookies(jar),
+                "saved": now,
+                "expires": now + self.max_age,
+            }
+            self._write(data)
+
+    def clear(self, user, country):
+        with self._lock:
+            data = self._read()
+            if data.pop(self._key(user, country), None) is not None:
+                self._write(data)
@@ -0,0 +1,244 @@
+# Copyright 2017 Sean Dague
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Record the HTTP traffic of a MyChevy session and replay it offline.
+
+Both ends are transport adapters, passed to MyChevy as ``adapter=``::
+
+    cassette = Cassette()
+    page = MyChevy(user, passwd,
+                   adapter=RecordingAdapter(cassette, [user, passwd]))
+    page.login(); page.get_cars(); page.update_cars()
+    cassette.save("session.json.gz")
+
+    page = MyChevy("user", "passwd",
+                   adapter=ReplayAdapter(Cassette.load("session.json.gz")))
+
+Recorded responses have passwords, tokens, csrf values and cookies
+scrubbed, so a cassette can be shared. Replay never touches the
+network, and runs at the recorded latency or (by default) none.
+"""
+
+import base64
+import gzip
+import http.client
+import io
+import json
+import re
+import threading
+import time
+import urllib.parse
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+SCRUBBED = "SCRUBBED"
+VERSION = 1
+
+# Response headers worth keeping, the rest are noise.
+KEEP_HEADERS = ("Content-Type", "Location", "Set-Cookie")
+# Query parameters whose values are scrubbed from urls.
+SECRET_PARAMS = ("csrf_token", "id_token")
+# Secrets in response bodies, the first group is kept and the rest of
+# the match replaced.
+SECRET_PATTERNS = (
+    re.compile(r"(name='id_token'.*?value=')[^']*"),
+    re.compile(r'("csrf"\s*:\s*")[^"]*'),
+)
+
+
+class CassetteError(Exception):
+    """Replay got a request the cassette doesn't have next."""
+
+
+class Cassette(object):
+    """The recorded interactions, in the order they happened."""
+
+    def __init__(self, interactions=None):
+        super(Cassette, self).__init__()
+        self.interactions = interactions or []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.interactions)
+
+    def add(self, interaction):
+        with self._lock:
+            self.interactions.append(interaction)
+
+    def save(self, path):
+        data = {"version": VERSION, "interactions": self.interactions}
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != VERSION:
+            raise CassetteError("Unsupported cassette version %r"
+                                % data.get("version"))
+        return cls(data["interactions"])
+
+
+class _Scrubber(object):
+    def __init__(self, secrets):
+        values = set()
+        for s in secrets:
+            if s:
+                values.update((s, urllib.parse.quote(s),
+                               urllib.parse.quote_plus(s)))
+        # longest first, so a secret containing another is fully replaced
+        self.secrets = sorted(values, key=len, reverse=True)
+
+    def text(self, value):
+        for s in self.secrets:
+            value = value.replace(s, SCRUBBED)
+        for pattern in SECRET_PATTERNS:
+            value = pattern.sub(r"\g<1>" + SCRUBBED, value)
+        return value
+
+    def url(self, value):
+        parts = urllib.parse.urlsplit(value)
+        query = urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+        query = [(k, SCRUBBED if k in SECRET_PARAMS else v) for k, v in query]
+        parts = parts._replace(query=urllib.parse.urlencode(query))
+        return self.text(urllib.parse.urlunsplit(parts))
+
+    def cookie(self, value):
+        name, _, rest = value.partition("=")
+        _, sep, attrs = rest.partition(";")
+        return self.text("%s=%s%s%s" % (name, SCRUBBED, sep, attrs))
+
+
+class RecordingAdapter(HTTPAdapter):
+    """An HTTPAdapter that adds everything it sends to a Cassette.
+
+    secrets are strings (user name, password, ...) replaced with
+    SCRUBBED wherever they show up. Request bodies aren't recorded at
+    all, as they carry the password.
+    """
+
+    def __init__(self, cassette, secrets=(), **kwargs):
+        super(RecordingAdapter, self).__init__(**kwargs)
+        self.cassette = cassette
+        self.scrub = _Scrubber(secrets)
+
+    def send(self, request, **kwargs):
+        # r.elapsed is only set by the Session once we have returned
+        start = time.monotonic()
+        r = super(RecordingAdapter, self).send(request, **kwargs)
+        body = r.content
+        latency = time.monotonic() - start
+        interaction = {
+            "method": request.method,
+            "url": self.scrub.url(request.url),
+            "status": r.status_code,
+            "latency": latency,
+            "headers": [],
+        }
+        for name in KEEP_HEADERS:
+            if name not in r.headers:
+                continue
+            if name == "Set-Cookie":
+                for cookie in r.raw.headers.getlist(name):
+                    interaction["headers"].append(
+                        [name, self.scrub.cookie(cookie)])
+            else:
+                interaction["headers"].append(
+                    [name, self.scrub.text(r.headers[name])])
+        try:
+            interaction["body"] = self.scrub.text(body.decode("utf-8"))
+        except UnicodeDecodeError:
+            interaction["body64"] = base64.b64encode(body).decode("ascii")
+        self.cassette.add(interaction)
+        return r
+
+
+def _path(url):
+    return urllib.parse.urlsplit(url).path
+
+
+class ReplayAdapter(BaseAdapter):
+    """Serve the interactions of a Cassette back.
+
+    Each request gets the earliest unused interaction with the same
+    method and path, so concurrent refreshes of several cars replay
+    fine even if they come in another order than recorded. latency
+    scales the recorded latency, 0 to answer instantly.
+    """
+
+    def __init__(self, cassette, latency=0):
+        super(ReplayAdapter, self).__init__()
+        self.cassette = cassette
+        self.latency = latency
+        self._lock = threading.Lock()
+        self.rewind()
+
+    def rewind(self):
+        """Make every interaction available again."""
+        self._used = [False] * len(self.cassette)
+        # everything before this has been used
+        self._start = 0
+
+    def _take(self, request):
+        key = (request.method, _path(request.url))
+        interactions = self.cassette.interactions
+        with self._lock:
+            for i in range(self._start, len(interactions)):
+                interaction = interactions[i]
+                if (self._used[i]
+                        or (interaction["method"],
+                            _path(interaction["url"])) != key):
+                    continue
+                used = self._used
+                used[i] = True
+                while self._start < len(used) and used[self._start]:
+                    self._start += 1
+                return interaction
+        raise CassetteError("No recorded %s %s left" % key)
+
+    def send(self, request, **kwargs):
+        interaction = self._take(request)
+        delay = interaction["latency"] * self.latency
+        if delay > 0:
+            time.sleep(delay)
+
+        if "body64" in interaction:
+            body = base64.b64decode(interaction["body64"])
+        else:
+            body = interaction["body"].encode("utf-8")
+
+        r = requests.Response()
+        r.status_code = interaction["status"]
+        r.headers = CaseInsensitiveDict()
+        for name, value in interaction["headers"]:
+            if name in r.headers:
+                r.headers[name] += ", " + value
+            else:
+                r.headers[name] = value
+        r.encoding = get_encoding_from_headers(r.headers)
+        r.raw = io.BytesIO(body)
+        r._content = body
+        r._content_consumed = True
+        r.url = request.url
+        r.request = request
+        r.reason = http.client.responses.get(r.status_code, "")
+        r.connection = self
+        return r
+
+    def close(self):
+        pass
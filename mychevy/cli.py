@@ -3,26 +3,51 @@
 """Console script for mychevy."""
 
 import configparser
+import json
 
 import click
 
+from mychevy.cache import SessionStore
+from mychevy.daemon import DEFAULT_SOCKET, REFRESH_INTERVAL, Daemon, query
+from mychevy.fleet import Fleet
 from mychevy.mychevy import MyChevy
+from mychevy.watch import BUFFER_SIZE, WATCH_INTERVAL, JsonLinesWriter, watch
 
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 
 
-@click.command(context_settings=CONTEXT_SETTINGS)
+def _read_config(ctx):
+    config = ctx.obj["config"]
+    if config is None:
+        raise click.UsageError("Missing option '--config' / '-c'.")
+    cfile = configparser.ConfigParser()
+    cfile.read_file(config)
+    return cfile
+
+
+def _default_account(ctx):
+    cfile = _read_config(ctx)
+    return MyChevy(cfile["default"]["user"], cfile["default"]["passwd"],
+                   session_store=ctx.obj["session_store"])
+
+
+@click.group(context_settings=CONTEXT_SETTINGS,
+             invoke_without_command=True)
 @click.option('--config', '-c', type=click.File('r'),
-              required=True,
               help="Config file with my.chevy credentials")
 @click.option('--show-browser', '-S', is_flag=True,
               help="Show browser window when running")
-def main(config=None, show_browser=None):
+@click.option('--session-cache', type=click.Path(dir_okay=False),
+              help="File to save the login session in between runs")
+@click.pass_context
+def main(ctx, config=None, show_browser=None, session_cache=None):
     """Console script for mychevy"""
-    cfile = configparser.ConfigParser()
-    cfile.read_file(config)
+    store = SessionStore(session_cache) if session_cache else None
+    ctx.obj = {"config": config, "session_store": store}
+    if ctx.invoked_subcommand is not None:
+        return
 
-    page = MyChevy(cfile["default"]["user"], cfile["default"]["passwd"])
+    page = _default_account(ctx)
     click.echo("Loading data, this takes up to 2 minutes...")
     page.login()
     page.get_cars()
@@ -31,5 +56,82 @@ def main(config=None, show_browser=None):
         click.echo(c)
 
 
+@main.command()
+@click.option('--socket', 'socket_path', default=DEFAULT_SOCKET,
+              show_default=True, help="Unix socket to listen on")
+@click.option('--interval', default=REFRESH_INTERVAL, show_default=True,
+              help="Seconds between refreshes")
+@click.pass_context
+def serve(ctx, socket_path, interval):
+    """Keep every account in the config logged in and refreshed."""
+    fleet = Fleet.from_config(_read_config(ctx),
+                              session_store=ctx.obj["session_store"])
+    click.echo("Serving %d accounts on %s" % (len(fleet.accounts),
+                                              socket_path))
+    try:
+        Daemon(fleet, socket_path, interval).serve_forever()
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fleet.close()
+
+
+@main.command(name="query")
+@click.option('--socket', 'socket_path', default=DEFAULT_SOCKET,
+              show_default=True, help="Unix socket of the daemon")
+@click.option('--vin', help="Only show the car with this vin")
+@click.option('--refresh', is_flag=True,
+              help="Ask the daemon to refresh now")
+def query_cmd(socket_path, vin, refresh):
+    """Show the cars known to a running 'mychevy serve' as json."""
+    if refresh:
+        request = {"cmd": "refresh"}
+    elif vin:
+        request = {"cmd": "car", "vin": vin}
+    else:
+        request = {"cmd": "cars"}
+
+    try:
+        response = query(request, socket_path)
+    except OSError as e:
+        raise click.ClickException("Can't reach daemon: %s" % e)
+    if not response["ok"]:
+        raise click.ClickException(response["error"])
+
+    if "car" in response:
+        click.echo(json.dumps(response["car"]))
+    for car in response.get("cars", ()):
+        click.echo(json.dumps(car))
+
+
+@main.command(name="watch")
+@click.option('--interval', default=WATCH_INTERVAL, show_default=True,
+              help="Seconds between refreshes")
+@click.option('--output', '-o', type=click.File('w'), default='-',
+              help="File to write JSON Lines to, stdout by default")
+@click.option('--buffer', 'buffer_size', default=BUFFER_SIZE,
+              show_default=True,
+              help="Records to hold for a slow reader before dropping")
+@click.option('--count', type=int,
+              help="Stop after this many refreshes")
+@click.pass_context
+def watch_cmd(ctx, interval, output, buffer_size, count):
+    """Refresh forever, writing one JSON object per car per refresh."""
+    page = _default_account(ctx)
+    page.login()
+    page.get_cars()
+
+    writer = JsonLinesWriter(output, buffer_size)
+    try:
+        watch(page, writer, interval, count)
+    except (KeyboardInterrupt, BrokenPipeError):
+        # e.g. 'mychevy watch | head'
+        pass
+    finally:
+        writer.close()
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,188 @@
+# Copyright 2017 Sean Dague
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Long running daemon that serves cached car state over a Unix socket.
+
+The protocol is one json request line, answered by one json response
+line. Requests are {"cmd": "cars"}, {"cmd": "car", "vin": ...} and
+{"cmd": "refresh"}. Responses are {"ok": true, ...} or {"ok": false,
+"error": ...}.
+"""
+
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_SOCKET = "~/.mychevy.sock"
+REFRESH_INTERVAL = 5 * 60
+QUERY_TIMEOUT = 10
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        try:
+            response = self.server.daemon.handle(json.loads(line))
+        except Exception as e:
+            response = {"ok": False, "error": str(e)}
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def _listening(socket_path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        return False
+    finally:
+        sock.close()
+    return True
+
+
+class Daemon(object):
+    """Keep a Fleet logged in and refreshed, and answer queries about it.
+
+    Queries are answered from the state cached after the last refresh,
+    so they never wait on GM.
+    """
+
+    def __init__(self, fleet, socket_path=DEFAULT_SOCKET,
+                 interval=REFRESH_INTERVAL):
+        super(Daemon, self).__init__()
+        self.fleet = fleet
+        self.socket_path = os.path.expanduser(socket_path)
+        self.interval = interval
+        # vin -> EVCar.as_dict() as of the last refresh
+        self.cars = {}
+        # vin -> error message of the last refresh, if it failed
+        self.errors = {}
+        self.last_refresh = None
+        self.server = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def refresh(self):
+        cars = {}
+        errors = {}
+        for result in self.fleet.iter_refresh():
+            if result.error is not None:
+                key = result.car.vin if result.car else result.account.user
+                errors[key] = str(result.error)
+        for car in self.fleet.cars:
+            cars[car.vin] = car.as_dict()
+        with self._lock:
+            self.cars = cars
+            self.errors = errors
+            self.last_refresh = time.time()
+
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                _LOGGER.exception("Refresh failed")
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    def handle(self, request):
+        cmd = request.get("cmd")
+        with self._lock:
+            if cmd == "cars":
+                return {
+                    "ok": True,
+                    "cars": list(self.cars.values()),
+                    "errors": self.errors,
+                    "last_refresh": self.last_refresh,
+                }
+            if cmd == "car":
+                car = self.cars.get(request.get("vin"))
+                if car is None:
+                    return {"ok": False, "error": "No car with that vin"}
+                return {"ok": True, "car": car,
+                        "last_refresh": self.last_refresh}
+        if cmd == "refresh":
+            self._wakeup.set()
+            return {"ok": True}
+        return {"ok": False, "error": "Unknown command %r" % cmd}
+
+    def start(self):
+        """Start serving and refreshing in background threads.
+
+        Raises RuntimeError if another daemon is already listening on
+        the socket. A stale socket left by one that died is replaced.
+        """
+        if os.path.exists(self.socket_path):
+            if _listening(self.socket_path):
+                raise RuntimeError(
+                    "A daemon is already listening on %s" % self.socket_path
+                )
+            os.unlink(self.socket_path)
+        # The socket serves account emails and car data, so create it
+        # owner only rather than chmod it after it is already reachable.
+        umask = os.umask(0o177)
+        try:
+            self.server = _Server(self.socket_path, _Handler)
+        finally:
+            os.umask(umask)
+        self.server.daemon = self
+
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._refresh_loop, daemon=True),
+            threading.Thread(target=self.server.serve_forever, daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        self.server.shutdown()
+        self.server.server_close()
+        for t in self._threads:
+            t.join()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def serve_forever(self):
+        self.start()
+        try:
+            self._stop.wait()
+        finally:
+            self.stop()
+
+
+def query(request, socket_path=DEFAULT_SOCKET, timeout=QUERY_TIMEOUT):
+    """Send one request to a running daemon and return its response."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(os.path.expanduser(socket_path))
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        with sock.makefile("rb") as f:
+            return json.loads(f.readline())
+    finally:
+        sock.close()
@@ -0,0 +1,226 @@
+# Copyright 2017 Sean Dague
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Metrics derived from successive snapshots of a car.
+
+DerivedMetrics is updated in O(1) as each refresh lands. derive() and
+summarize() recompute the same things over a whole VehicleHistory at
+once, vectorized with NumPy when it is installed.
+"""
+
+import bisect
+import math
+
+from mychevy.history import CODEBOOKS
+from mychevy.scheduler import parse_full_charge_by
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+# Time constant of the miles per day average: a day's driving counts
+# for about 1 - 1/e of the average after this long.
+MILES_TAU = 7 * DAY
+
+
+def _number(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return None
+
+
+def _timestamp(car):
+    if car.dataAsOfDate is not None:
+        return car.dataAsOfDate / 1000.0
+    return car.last_update
+
+
+class DerivedMetrics(object):
+    """Rates worked out from the previous and the latest snapshot.
+
+    Attributes are None until there is enough data:
+        charge_rate: Battery percent gained per hour while charging.
+        range_rate: Electric range miles gained per hour while charging.
+        miles_per_day: Time weighted moving average of miles driven.
+        time_to_full: Seconds until fully charged, from
+            estimatedFullChargeBy if OnStar gave one, else from
+            charge_rate.
+        eta_skew: Seconds our own time to full differs from OnStar's.
+    """
+
+    __slots__ = (
+        "charge_rate",
+        "range_rate",
+        "miles_per_day",
+        "time_to_full",
+        "eta_skew",
+        "_last",
+    )
+
+    def __init__(self):
+        super(DerivedMetrics, self).__init__()
+        self.charge_rate = None
+        self.range_rate = None
+        self.miles_per_day = None
+        self.time_to_full = None
+        self.eta_skew = None
+        # (timestamp, batteryLevel, electricRange, totalMiles, charging)
+        self._last = None
+
+    def update(self, car):
+        """Take in the car's latest snapshot."""
+        now = _timestamp(car)
+        if now is None:
+            return
+        battery = _number(car.batteryLevel)
+        erange = _number(car.electricRange)
+        miles = _number(car.totalMiles)
+        charging = car.charging
+
+        last = self._last
+        if last is not None and now <= last[0]:
+            # the same (or older) data again, nothing new to learn
+            return
+        self._last = (now, battery, erange, miles, charging)
+
+        if last is not None:
+            dt = now - last[0]
+            if not charging:
+                self.charge_rate = self.range_rate = None
+            elif last[4]:
+                if battery is not None and last[1] is not None:
+                    self.charge_rate = (battery - last[1]) / dt * HOUR
+                if erange is not None and last[2] is not None:
+                    self.range_rate = (erange - last[2]) / dt * HOUR
+            if miles is not None and last[3] is not None:
+                rate = (miles - last[3]) / dt * DAY
+                if self.miles_per_day is None:
+                    self.miles_per_day = rate
+                else:
+                    alpha = 1 - math.exp(-dt / MILES_TAU)
+                    self.miles_per_day += alpha * (rate - self.miles_per_day)
+
+        self.time_to_full = self.eta_skew = None
+        if not charging:
+            return
+        ours = None
+        if self.charge_rate and self.charge_rate > 0 and battery is not None:
+            ours = max(0.0, 100 - battery) / self.charge_rate * HOUR
+        eta = parse_full_charge_by(car.estimatedFullChargeBy, now)
+        if eta is not None:
+            self.time_to_full = eta - now
+            if ours is not None:
+                self.eta_skew = ours - self.time_to_full
+        else:
+            self.time_to_full = ours
+
+    def as_dict(self):
+        return {
+            "charge_rate": self.charge_rate,
+            "range_rate": self.range_rate,
+            "miles_per_day": self.miles_per_day,
+            "time_to_full": self.time_to_full,
+            "eta_skew": self.eta_skew,
+        }
+
+
+def derive(history):
+    """Per interval rates over every snapshot of a VehicleHistory.
+
+    Returns a dict of columns one shorter than the history: dt, and
+    charge_rate, range_rate (per hour, NaN unless charging at both ends)
+    and miles_per_day. NumPy arrays if NumPy is installed, lists
+    otherwise.
+    """
+    t = history.values("timestamp")
+    battery = history.values("batteryLevel")
+    erange = history.values("electricRange")
+    miles = history.values("totalMiles")
+    states = history.values("chargeState")
+    code = CODEBOOKS["chargeState"].codes.get("charging", -1)
+
+    if np is not None:
+        charging = states == code
+        both = charging[1:] & charging[:-1]
+        dt = np.diff(t)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rate = np.where(dt > 0, 1 / dt, np.nan)
+            return {
+                "dt": dt,
+                "charge_rate": np.where(both, np.diff(battery) * rate * HOUR,
+                                        np.nan),
+                "range_rate": np.where(both, np.diff(erange) * rate * HOUR,
+                                       np.nan),
+                "miles_per_day": np.diff(miles) * rate * DAY,
+            }
+
+    columns = {"dt": [], "charge_rate": [], "range_rate": [],
+               "miles_per_day": []}
+    for i in range(1, len(t)):
+        dt = t[i] - t[i - 1]
+        rate = 1 / dt if dt > 0 else math.nan
+        both = states[i] == code and states[i - 1] == code
+        columns["dt"].append(dt)
+        columns["charge_rate"].append(
+            (battery[i] - battery[i - 1]) * rate * HOUR if both else math.nan)
+        columns["range_rate"].append(
+            (erange[i] - erange[i - 1]) * rate * HOUR if both else math.nan)
+        columns["miles_per_day"].append((miles[i] - miles[i - 1]) * rate * DAY)
+    return columns
+
+
+def _weighted_mean(values, weights):
+    total = weight = 0.0
+    for v, w in zip(values, weights):
+        if not math.isnan(v) and w > 0:
+            total += v * w
+            weight += w
+    return total / weight if weight else None
+
+
+def summarize(history, window=None):
+    """Average rates over the last ``window`` seconds of a history.
+
+    Rates are weighted by interval length, so they are totals over
+    time rather than an average of noisy short intervals. Returns a
+    dict of charge_rate, range_rate and miles_per_day, None where there
+    is no data.
+    """
+    columns = derive(history)
+    dt = columns["dt"]
+    if window is not None and len(dt):
+        t = history.values("timestamp")
+        first = min(bisect.bisect_left(t, t[-1] - window), len(dt))
+        columns = {k: v[first:] for k, v in columns.items()}
+        dt = columns["dt"]
+
+    summary = {}
+    for name in ("charge_rate", "range_rate", "miles_per_day"):
+        values = columns[name]
+        if np is not None:
+            ok = ~np.isnan(values) & (dt > 0)
+            weight = dt[ok].sum()
+            summary[name] = (float((values[ok] * dt[ok]).sum() / weight)
+                             if weight else None)
+        else:
+            summary[name] = _weighted_mean(values, dt)
+    return summary
+
+
+def fleet_summary(histories, window=None):
+    """summarize() every history of a dict of vin -> VehicleHistory."""
+    return {vin: summarize(h, window) for vin, h in histories.items()}
@@ -0,0 +1,149 @@
+# Copyright 2017 Sean Dague
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Manage many MyChevy accounts with one shared worker pool."""
+
+import collections
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import logging
+import threading
+
+from mychevy.history import columnar
+from mychevy.mychevy import (
+    MAX_WORKERS,
+    POOL_CONNECTIONS,
+    MyChevy,
+    make_adapter,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# One outcome of a refresh. car is None if the account failed to log
+# in, error is None on success.
+FleetResult = collections.namedtuple(
+    "FleetResult", ["account", "car", "error"]
+)
+
+
+class Fleet(object):
+    """A set of MyChevy accounts refreshed together.
+
+    Accounts are logged in lazily on their first refresh. All of them
+    share one worker pool and one HTTP adapter, so connections to GM are
+    pooled across accounts instead of per account.
+    """
+
+    def __init__(
+        self,
+        max_workers=MAX_WORKERS,
+        session_store=None,
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=None,
+        keep_alive=True,
+    ):
+        super(Fleet, self).__init__()
+        self.accounts = []
+        self.max_workers = max_workers
+        self.session_store = session_store
+        self.keep_alive = keep_alive
+        # every worker may hold a connection, so by default size the
+        # pools to the number of workers
+        self.adapter = make_adapter(
+            pool_connections, pool_maxsize or max_workers
+        )
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._login_locks = {}
+
+    @classmethod
+    def from_config(cls, cfile, **kwargs):
+        """Build a fleet from a config with one section per account.
+
+        Every section with a user and passwd is an account, and may set
+        country (defaults to us).
+        """
+        fleet = cls(**kwargs)
+        for name in cfile.sections():
+            section = cfile[name]
+            if "user" in section and "passwd" in section:
+                fleet.add_account(
+                    section["user"],
+                    section["passwd"],
+                    section.get("country", "us"),
+                )
+        return fleet
+
+    def add_account(self, user, passwd, country="us", urls=None):
+        page = MyChevy(
+            user,
+            passwd,
+            country,
+            session_store=self.session_store,
+            adapter=self.adapter,
+            keep_alive=self.keep_alive,
+            urls=urls,
+        )
+        self.accounts.append(page)
+        self._login_locks[id(page)] = threading.Lock()
+        return page
+
+    def _ensure_login(self, page):
+        with self._login_locks[id(page)]:
+            # a failed login leaves a session behind, but no account
+            if page.account is None:
+                _LOGGER.debug("Logging in %s", page.user)
+                page.login()
+                page.get_cars()
+
+    def iter_refresh(self, max_age=None):
+        """Refresh every car of every account.
+
+        Yields a FleetResult per car as soon as it is done, plus one for
+        each account that failed to log in. max_age works as it does for
+        MyChevy.update_cars.
+        """
+        pending = {}
+        for page in self.accounts:
+            pending[self._pool.submit(self._ensure_login, page)] = (page, None)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                page, car = pending.pop(future)
+                error = future.exception()
+                if car is not None:
+                    yield FleetResult(page, car, error)
+                elif error is not None:
+                    _LOGGER.warning(
+                        "Failed to log in %s: %s", page.user, error
+                    )
+                    yield FleetResult(page, None, error)
+                else:
+                    for c in page._stale_cars(max_age):
+                        f = self._pool.submit(page._fetch_car, c)
+                        pending[f] = (page, c)
+
+    def refresh_all(self, max_age=None):
+        return list(self.iter_refresh(max_age))
+
+    @property
+    def cars(self):
+        return [c for page in self.accounts for c in page.cars]
+
+    def snapshot(self):
+        """Every car of every account as columns, see history.columnar."""
+        return columnar(self.cars)
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        self.adapter.close()
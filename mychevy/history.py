@@ -0,0 +1,214 @@
+# Copyright 2017 Sean Dague
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Compact in memory history of vehicle snapshots."""
+
+from array import array
+import math
+import threading
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+# A week of polling every 5 minutes.
+HISTORY_SIZE = 7 * 24 * 12
+
+# Numeric CAR_ATTRS, stored as 32 bit floats (NaN when unknown).
+NUMERIC_ATTRS = (
+    "batteryLevel",
+    "electricRange",
+    "totalRange",
+    "totalMiles",
+    "electricMiles",
+    "gasRange",
+    "gasFuelLevelPercentage",
+    "fuelEconomy",
+    "gasMiles",
+    "voltage",
+)
+
+# String CAR_ATTRS, stored as small integer codes with the array
+# typecode to use. Code 0 is always the empty string.
+CODED_ATTRS = {
+    "chargeMode": "B",
+    "chargeState": "B",
+    "estimatedFullChargeBy": "H",
+}
+
+
+class Codebook(object):
+    """Map strings to small integers, shared by every history."""
+
+    def __init__(self, limit):
+        super(Codebook, self).__init__()
+        self.limit = limit
+        self.values = [""]
+        self.codes = {"": 0}
+        self._lock = threading.Lock()
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is not None:
+            return code
+        with self._lock:
+            if value not in self.codes:
+                if len(self.values) >= self.limit:
+                    # out of codes, store as unknown rather than fail
+                    return 0
+                self.codes[value] = len(self.values)
+                self.values.append(value)
+            return self.codes[value]
+
+    def decode(self, code):
+        return self.values[code]
+
+
+CODEBOOKS = {
+    name: Codebook(2 ** (8 * array(typecode).itemsize))
+    for name, typecode in CODED_ATTRS.items()
+}
+
+
+def _number(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    return math.nan
+
+
+class VehicleHistory(object):
+    """Ring buffer of the last ``size`` snapshots of one car.
+
+    Every column is a preallocated typed array, so a snapshot costs a
+    fixed ~50 bytes no matter how many are kept.
+    """
+
+    def __init__(self, size=HISTORY_SIZE):
+        super(VehicleHistory, self).__init__()
+        self.size = size
+        self.timestamps = array("d", [math.nan]) * size
+        self.numeric = {
+            a: array("f", [math.nan]) * size for a in NUMERIC_ATTRS
+        }
+        self.coded = {
+            a: array(typecode, [0]) * size
+            for a, typecode in CODED_ATTRS.items()
+        }
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, car):
+        """Record the current state of car.
+
+        The snapshot is timestamped with dataAsOfDate when OnStar gave us
+        one, otherwise with the time of the refresh.
+        """
+        i = self._next
+        if car.dataAsOfDate is not None:
+            self.timestamps[i] = car.dataAsOfDate / 1000.0
+        else:
+            self.timestamps[i] = car.last_update or math.nan
+        for a, col in self.numeric.items():
+            col[i] = _number(getattr(car, a))
+        for a, col in self.coded.items():
+            col[i] = CODEBOOKS[a].encode(getattr(car, a) or "")
+
+        self._next = (i + 1) % self.size
+        self._count = min(self._count + 1, self.size)
+
+    def _indexes(self):
+        start = (self._next - self._count) % self.size
+        return [(start + n) % self.size for n in range(self._count)]
+
+    def column(self, name):
+        """All recorded values of one attribute, oldest first."""
+        idx = self._indexes()
+        if name == "timestamp":
+            return [self.timestamps[i] for i in idx]
+        if name in self.numeric:
+            col = self.numeric[name]
+            return [None if math.isnan(col[i]) else col[i] for i in idx]
+        col = self.coded[name]
+        decode = CODEBOOKS[name].decode
+        return [decode(col[i]) for i in idx]
+
+    def values(self, name):
+        """Like column(), as one array with NaN for unknown values.
+
+        Only for timestamp and numeric attributes, or the integer codes
+        of coded ones. A NumPy array if NumPy is installed.
+        """
+        if name == "timestamp":
+            col = self.timestamps
+        elif name in self.numeric:
+            col = self.numeric[name]
+        else:
+            col = self.coded[name]
+        if np is not None:
+            start = (self._next - self._count) % self.size
+            values = np.roll(np.frombuffer(col, dtype=col.typecode), -start)
+            values = values[: self._count]
+            return values if name in self.coded else values.astype(np.float64)
+        return array(col.typecode, (col[i] for i in self._indexes()))
+
+    def _row(self, i):
+        row = {"timestamp": self.timestamps[i]}
+        for a, col in self.numeric.items():
+            row[a] = None if math.isnan(col[i]) else col[i]
+        for a, col in self.coded.items():
+            row[a] = CODEBOOKS[a].decode(col[i])
+        return row
+
+    def snapshots(self):
+        """Yield each recorded snapshot as a dict, oldest first."""
+        for i in self._indexes():
+            yield self._row(i)
+
+    def latest(self):
+        if not self._count:
+            return None
+        return self._row((self._next - 1) % self.size)
+
+
+def columnar(cars):
+    """Turn a list of cars into a dict of columns.
+
+    Numeric CAR_ATTRS and dataAsOfDate become float arrays (NaN when
+    unknown), everything else a list. The arrays are NumPy arrays if
+    NumPy is installed, array.array otherwise.
+    """
+    columns = {
+        "vin": [c.vin for c in cars],
+        "plugged_in": [c.plugged_in for c in cars],
+    }
+    for a in CODED_ATTRS:
+        columns[a] = [getattr(c, a) for c in cars]
+
+    numeric = {
+        a: [_number(getattr(c, a)) for c in cars] for a in NUMERIC_ATTRS
+    }
+    numeric["dataAsOfDate"] = [_number(c.dataAsOfDate) for c in cars]
+    for a, values in numeric.items():
+        if np is not None:
+            columns[a] = np.array(values, dtype=np.float64)
+        else:
+            columns[a] = array("d", values)
+
+    if np is not None:
+        columns["plugged_in"] = np.array(columns["plugged_in"], dtype=bool)
+    return columns
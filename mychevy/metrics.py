@@ -0,0 +1,110 @@
+# Copyright 2017 Sean Dague
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""In memory request metrics, exportable in Prometheus text format."""
+
+import bisect
+import collections
+import threading
+
+from mychevy.mychevy import Metrics
+
+# Request duration buckets in seconds, up to the 120s request timeout.
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class _Phase(object):
+    __slots__ = ("buckets", "sum", "count", "bytes", "retried", "statuses")
+
+    def __init__(self, nbuckets):
+        self.buckets = [0] * nbuckets
+        self.sum = 0.0
+        self.count = 0
+        self.bytes = 0
+        self.retried = 0
+        self.statuses = collections.Counter()
+
+
+class HistogramCollector(Metrics):
+    """Collect a latency histogram and counters per phase.
+
+    Pass one as metrics= to any number of MyChevy instances, and serve
+    render() from your /metrics endpoint.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, prefix="mychevy"):
+        super(HistogramCollector, self).__init__()
+        self.bounds = tuple(sorted(buckets))
+        self.prefix = prefix
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def observe(self, phase, duration, size, status, retries):
+        with self._lock:
+            p = self.phases.get(phase)
+            if p is None:
+                p = self.phases[phase] = _Phase(len(self.bounds))
+            i = bisect.bisect_left(self.bounds, duration)
+            if i < len(self.bounds):
+                p.buckets[i] += 1
+            p.sum += duration
+            p.count += 1
+            p.bytes += size
+            if retries:
+                p.retried += 1
+            p.statuses["error" if status is None else str(status)] += 1
+
+    def render(self):
+        """Everything collected so far in Prometheus text format."""
+        name = self.prefix + "_request_duration_seconds"
+        lines = [
+            "# HELP %s Duration of requests to GM by phase." % name,
+            "# TYPE %s histogram" % name,
+        ]
+        counters = {
+            "response_bytes": ("Response bytes received by phase.", []),
+            "responses": ("Responses by phase and status.", []),
+            "retried_requests": ("Requests made on a retry by phase.", []),
+        }
+
+        with self._lock:
+            for phase in sorted(self.phases):
+                p = self.phases[phase]
+                cumulative = 0
+                for bound, n in zip(self.bounds, p.buckets):
+                    cumulative += n
+                    lines.append('%s_bucket{phase="%s",le="%s"} %d'
+                                 % (name, phase, bound, cumulative))
+                lines.append('%s_bucket{phase="%s",le="+Inf"} %d'
+                             % (name, phase, p.count))
+                lines.append('%s_sum{phase="%s"} %s' % (name, phase, p.sum))
+                lines.append('%s_count{phase="%s"} %d'
+                             % (name, phase, p.count))
+
+                counters["response_bytes"][1].append(
+                    ('phase="%s"' % phase, p.bytes))
+                counters["retried_requests"][1].append(
+                    ('phase="%s"' % phase, p.retried))
+                for status in sorted(p.statuses):
+                    counters["responses"][1].append(
+                        ('phase="%s",status="%s"' % (phase, status),
+                         p.statuses[status]))
+
+        for counter, (help_text, samples) in counters.items():
+            cname = "%s_%s_total" % (self.prefix, counter)
+            lines.append("# HELP %s %s" % (cname, help_text))
+            lines.append("# TYPE %s counter" % cname)
+            for labels, value in samples:
+                lines.append("%s{%s} %d" % (cname, labels, value))
+        return "\n".join(lines) + "\n"
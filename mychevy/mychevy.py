@@ -14,25 +14,56 @@
 
 """Main module."""
 
+import collections
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
 import json
 import logging
 import re
+import threading
 import time
 import urllib
 
 import requests
 
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+except ImportError:  # pragma: no cover
+    _json_loads = json.loads
+
+from mychevy.cache import load_cookies
+from mychevy.derived import DerivedMetrics
+from mychevy.history import HISTORY_SIZE, VehicleHistory, columnar
+from mychevy.ratelimit import DEFAULT_LIMITER
+from mychevy.retry import (
+    ACCOUNT_RETRY_LIMIT,
+    GLOBAL_RETRY_BUDGET,
+    RetryBudget,
+    RetryPolicy,
+    breaker_for,
+)
+from mychevy.singleflight import SingleFlight
+
 _LOGGER = logging.getLogger(__name__)
 
 TIMEOUT = 120
 KEY = 15258643512041
+MAX_WORKERS = 4
+# Connection pools kept (one per host), and connections kept per pool.
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = MAX_WORKERS
+# How long we reuse a createAppSessionKey result before asking again.
+APP_SESSION_TTL = 15 * 60
 
 LOGIN_URL = "https://custlogin.gm.com/gmb2cprod.onmicrosoft.com/B2C_1A_SeamlessMigration_SignUpOrSignIn/SelfAsserted?tx={}&p=B2C_1A_SeamlessMigration_SignUpOrSignIn"  # noqa
 TOKEN_URL = "https://custlogin.gm.com/gmb2cprod.onmicrosoft.com/B2C_1A_SeamlessMigration_SignUpOrSignIn/api/CombinedSigninAndSignup/confirmed?csrf_token={}&tx={}&p=B2C_1A_SeamlessMigration_SignUpOrSignIn"  # noqa
 
 URLS = {
     "us": {
+        "self_asserted": LOGIN_URL,
+        "token": TOKEN_URL,
         "success": "https://my.chevrolet.com/init/loginSuccessData",
         "oc_login": "https://my.chevrolet.com/oc_login",
         "loginSuccessData": "https://my.chevrolet.com/api/init/loginSuccessData",
@@ -48,6 +79,8 @@ URLS = {
         ),
     },
     "ca": {
+        "self_asserted": LOGIN_URL,
+        "token": TOKEN_URL,
         "success": "https://my.gm.ca/chevrolet/en/init/loginSuccessData",
         "home": "https://my.gm.ca/gm/en/home",
         "oc_login": "https://my.gm.ca/gm/en/oc_login",
@@ -69,6 +102,17 @@ def get_url(kind="", country="us"):
     return URLS[country][kind]
 
 
+def make_adapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE):
+    """A transport adapter that can be shared by many MyChevy instances.
+
+    pool_maxsize should be at least the number of threads refreshing
+    through it, or connections get thrown away instead of reused.
+    """
+    return requests.adapters.HTTPAdapter(
+        pool_connections=pool_connections, pool_maxsize=pool_maxsize
+    )
+
+
 settings_json_re = re.compile("var SETTINGS = ({.*})")
 id_token_re = re.compile("name='id_token'.*value='(.*)'/>")
 
@@ -87,6 +131,29 @@ class ServerError(Exception):
     pass
 
 
+class CircuitOpenError(ServerError):
+    """OnStar has been failing broadly, so we didn't even try."""
+
+
+class VehicleError(ServerError):
+    """OnStar answered, but with an error for this one car.
+
+    Typically the car is offline. Retried and counted by the circuit
+    breaker like any ServerError: a few offline cars can't open it, as
+    every successful call in between resets the count, but OnStar
+    answering this for every car can.
+    """
+
+
+class SessionExpired(Exception):
+    """my.chevrolet.com no longer accepts our login session."""
+
+
+# Errors worth trying again: OnStar errors, 5xx responses (raised as
+# ServerError), and transport failures.
+RETRYABLE_ERRORS = (ServerError, requests.ConnectionError, requests.Timeout)
+
+
 CAR_ATTRS = (
     "chargeMode",
     "chargeState",
@@ -104,6 +171,44 @@ CAR_ATTRS = (
 )
 
 
+# Fields whose changes are reported to EVCar subscribers.
+WATCHED_ATTRS = ("plugged_in",) + CAR_ATTRS
+
+# What an EVCar subscriber is called with. changes is a dict of
+# field -> (old, new) for every WATCHED_ATTRS that changed.
+CarChange = collections.namedtuple(
+    "CarChange", ["car", "changes", "dataAsOfDate"]
+)
+
+
+class Metrics(object):
+    """Hook for timing the requests MyChevy makes.
+
+    The default does nothing. Subclass and override observe to collect,
+    see mychevy.metrics.HistogramCollector. Phases are home,
+    self_asserted, token, oc_login and login_success for login, and
+    session_key and evstats for fetching a car.
+    """
+
+    def observe(self, phase, duration, size, status, retries):
+        """Called once per request.
+
+        Args:
+            phase: Name of the request.
+            duration: Seconds the request took.
+            size: Response body size in bytes.
+            status: HTTP status code, None if the request failed.
+            retries: How many times the enclosing call had already been
+                retried when this request was made.
+        """
+
+
+NULL_METRICS = Metrics()
+
+# Retry count of the _retrying call running in this thread.
+_retry_state = threading.local()
+
+
 def retry(exceptions, tries=3, delay=3, backoff=2, logger=None):
     """
     Retry calling the decorated function using an exponential backoff.
@@ -141,20 +246,51 @@ def retry(exceptions, tries=3, delay=3, backoff=2, logger=None):
     return deco_retry
 
 
+def _is_json(content):
+    return content.lstrip()[:1] in (b"{", b"[")
+
+
 class EVCar(object):
+    # Slotted, as a fleet can hold thousands of these.
+    __slots__ = (
+        "vin",
+        "vid",
+        "onstar",
+        "year",
+        "make",
+        "model",
+        "img",
+        "plugged_in",
+        "dataAsOfDate",
+        "last_update",
+        "fetch_latency",
+        "history",
+        "derived",
+        "subscribers",
+    ) + CAR_ATTRS
+
     def __init__(self, car):
         super(EVCar, self).__init__()
-        self.vin = car["vin"]
-        self.vid = car["vehicle_id"]
-        self.onstar = car["onstarAccountNumber"]
-        self.year = car["year"]
-        self.make = car["make"]
-        self.model = car["model"]
-        self.img = car["imageUrl"]
+        self.set_vehicle(car)
 
         # computed binaries
         self.plugged_in = False
 
+        # when OnStar says the data was collected (ms since epoch), and
+        # when we last successfully refreshed it (local time.time())
+        self.dataAsOfDate = None
+        self.last_update = None
+        # seconds the last successful fetch took, retries included
+        self.fetch_latency = None
+
+        # optional VehicleHistory every refresh is recorded in
+        self.history = None
+        # optional DerivedMetrics, updated on every refresh
+        self.derived = None
+        # callbacks for changes, None rather than an empty list as most
+        # cars never get any
+        self.subscribers = None
+
         # car stats that we'll update later
         self.chargeMode = ""
         self.fuelEconomy = 0
@@ -170,6 +306,45 @@ class EVCar(object):
         self.voltage = 0
         self.estimatedFullChargeBy = ""
 
+    def subscribe(self, callback):
+        """Call callback with a CarChange whenever from_json changes fields.
+
+        Callbacks run in whatever thread refreshed the car, and
+        exceptions from them are logged and otherwise ignored.
+        """
+        if self.subscribers is None:
+            self.subscribers = []
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if self.subscribers and callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def _notify(self, before):
+        changes = {}
+        for a, old in zip(WATCHED_ATTRS, before):
+            new = getattr(self, a)
+            if new != old:
+                changes[a] = (old, new)
+        if not changes:
+            return
+        event = CarChange(self, changes, self.dataAsOfDate)
+        for callback in list(self.subscribers):
+            try:
+                callback(event)
+            except Exception:
+                _LOGGER.exception("Subscriber of %s failed", self.vin)
+
+    def set_vehicle(self, car):
+        """Set the static vehicle info from a loginSuccessData entry."""
+        self.vin = car["vin"]
+        self.vid = car["vehicle_id"]
+        self.onstar = car["onstarAccountNumber"]
+        self.year = car["year"]
+        self.make = car["make"]
+        self.model = car["model"]
+        self.img = car["imageUrl"]
+
     @property
     def name(self):
         return "{0} {1} {2}".format(self.year, self.make, self.model)
@@ -178,34 +353,87 @@ class EVCar(object):
     def charging(self):
         return self.chargeState == "charging"
 
+    @property
+    def age(self):
+        """Seconds since the last successful refresh, None if never."""
+        if self.last_update is None:
+            return None
+        return time.time() - self.last_update
+
+    def is_fresh(self, max_age):
+        age = self.age
+        return age is not None and age < max_age
+
     def update(self, *args, **kwargs):
         for k, v in kwargs.items():
-            if hasattr(self, k):
+            if k in _EVCAR_FIELDS:
                 setattr(self, k, v)
             else:
                 raise KeyError("No attribute named %s" % k)
 
     def from_json(self, data):
+        """Update the car from an evstats response.
+
+        Returns True if OnStar gave us newer data than we had.
+        """
         try:
-            res = json.loads(data.decode("utf-8"))
+            # both json and orjson take the raw bytes, skip the decode
+            res = _json_loads(data)
 
             # I've never actually seen serverErrorMsgs, but allow for them
-            if res["serverErrorMsgs"] or type(res["data"]) == str:
-                raise ServerError(res)
+            if res["serverErrorMsgs"] or isinstance(res["data"], str):
+                raise VehicleError(res)
 
             d = res["data"]
 
+            subscribers = self.subscribers
+            if subscribers:
+                before = [getattr(self, a) for a in WATCHED_ATTRS]
+
             self.plugged_in = d["plugState"] == "plugged"
-            _LOGGER.debug("Data: {}".format(d))
+            _LOGGER.debug("Data: %s", d)
             for a in CAR_ATTRS:
                 # if the attr exists, set it
                 if a in d:
                     setattr(self, a, d[a])
 
+            as_of = d.get("dataAsOfDate")
+            changed = as_of is None or as_of != self.dataAsOfDate
+            self.dataAsOfDate = as_of
+            self.last_update = time.time()
+            if self.history is not None:
+                self.history.append(self)
+            if self.derived is not None:
+                self.derived.update(self)
+            if subscribers:
+                self._notify(before)
+            return changed
+
         except json.JSONDecodeError:
-            _LOGGER.exception("Failure to decode json: %s" % data)
+            _LOGGER.exception("Failure to decode json: %s", data)
         except KeyError:
             _LOGGER.exception("Expected key not found")
+        return False
+
+    def as_dict(self):
+        """The car as a plain, json serializable dict."""
+        d = {
+            "vin": self.vin,
+            "vehicle_id": self.vid,
+            "name": self.name,
+            "year": self.year,
+            "make": self.make,
+            "model": self.model,
+            "plugged_in": self.plugged_in,
+            "dataAsOfDate": self.dataAsOfDate,
+            "last_update": self.last_update,
+            "fetch_latency": self.fetch_latency,
+        }
+        for a in CAR_ATTRS:
+            d[a] = getattr(self, a)
+        if self.derived is not None:
+            d["derived"] = self.derived.as_dict()
+        return d
 
     def __str__(self):
         return (
@@ -230,26 +458,257 @@ class EVCar(object):
         )
 
 
+_EVCAR_FIELDS = frozenset(EVCar.__slots__)
+
+# What we keep of loginSuccessData: a tuple of vehicle dicts holding
+# just the VEHICLE_KEYS that EVCar.set_vehicle uses.
+Account = collections.namedtuple("Account", ["vehicles"])
+VEHICLE_KEYS = (
+    "vin",
+    "vehicle_id",
+    "onstarAccountNumber",
+    "year",
+    "make",
+    "model",
+    "imageUrl",
+)
+
+
+def parse_account(content):
+    """Parse a loginSuccessData response body into an Account.
+
+    Raises ServerError if GM reported one, ValueError if the body isn't
+    what we expect.
+    """
+    try:
+        data = _json_loads(content)
+        errors = data["serverErrorMsgs"]
+        if not errors:
+            vehicles = tuple(
+                {k: v[k] for k in VEHICLE_KEYS}
+                for v in data["data"]["vehicleMap"].values()
+            )
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise ValueError(
+            "Unexpected loginSuccessData (%d bytes): %s: %s"
+            % (len(content), type(e).__name__, e)
+        )
+    if errors:
+        raise ServerError(errors)
+    return Account(vehicles)
+
+
 class MyChevy(object):
-    def __init__(self, user, passwd, country="us"):
+    def __init__(
+        self,
+        user,
+        passwd,
+        country="us",
+        session_store=None,
+        app_session_ttl=APP_SESSION_TTL,
+        adapter=None,
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+        keep_alive=True,
+        history_size=HISTORY_SIZE,
+        metrics=None,
+        retry_policy=None,
+        retry_budget=None,
+        breaker=None,
+        urls=None,
+        session_lifetime=None,
+        rate_limiter=None,
+    ):
         super(MyChevy, self).__init__()
 
         self.user = user
         self.passwd = passwd
         self.cars = []
         self.cookies = None
-        self.history = []
+        # vin -> VehicleHistory, kept across get_cars calls
+        self.history = {}
+        self.history_size = history_size
+        # indexes of self.cars, maintained by get_cars
+        self._by_vin = {}
+        self._by_vid = {}
+        self.metrics = metrics or NULL_METRICS
+        # shared by all instances unless one is given
+        self.rate_limiter = rate_limiter or DEFAULT_LIMITER
+        self.retry_policy = retry_policy or RetryPolicy()
+        # retries are limited both per account and for the whole process
+        self.retry_budgets = (
+            retry_budget or RetryBudget(ACCOUNT_RETRY_LIMIT),
+            GLOBAL_RETRY_BUDGET,
+        )
+        # shared by every account talking to the same country's servers
+        self.breaker = breaker or breaker_for(country)
         self.session = None
+        # the Account parsed from loginSuccessData at login
         self.account = None
         self.country = country
+        # endpoints, defaults to the real ones for the country
+        self.urls = urls or URLS[country]
+        self.session_store = session_store
+        self.app_session_ttl = app_session_ttl
+        # Transport adapter, possibly shared with other accounts. It
+        # outlives the session, so connections survive a re-login.
+        self.adapter = adapter or make_adapter(pool_connections, pool_maxsize)
+        self.keep_alive = keep_alive
+        # vin -> time the app session key for that car stops being trusted
+        self._app_sessions = {}
+        # if set, log in again before the session gets this old (seconds)
+        self.session_lifetime = session_lifetime
+        self.logged_in_at = None
+        # bumped on every login, so threads that saw the session expire
+        # can tell whether someone already logged in again
+        self._login_generation = 0
+        self._login_lock = threading.RLock()
+        # why the last login by _relogin failed, None if it didn't
+        self._login_error = None
+        # concurrent fetches of the same car share one request, by vin
+        self._inflight = SingleFlight()
+        # callbacks given to every car, see subscribe
+        self.subscribers = []
+
+    def _new_session(self):
+        session = requests.Session()
+        session.mount("https://", self.adapter)
+        session.mount("http://", self.adapter)
+        if not self.keep_alive:
+            session.headers["Connection"] = "close"
+        return session
+
+    def _request(self, phase, method, url, **kwargs):
+        """Make a request on the session, reporting it to self.metrics.
+
+        Waits for the rate limiter first, which isn't counted in the
+        reported duration. Redirects are followed here rather than by
+        the session, so every hop waits for the rate limiter too.
+        """
+        follow = kwargs.pop("allow_redirects", True)
+        waited = self.rate_limiter.acquire(url, phase)
+        start = time.monotonic()
+        size = 0
+        status = None
+        try:
+            r = getattr(self.session, method)(
+                url, allow_redirects=False, **kwargs
+            )
+            history = []
+            while follow and r.is_redirect and r.next is not None:
+                if len(history) >= self.session.max_redirects:
+                    raise requests.TooManyRedirects(
+                        "Exceeded %d redirects" % self.session.max_redirects,
+                        response=r,
+                    )
+                history.append(r)
+                waited += self.rate_limiter.acquire(r.next.url, phase)
+                r = self.session.send(
+                    r.next, allow_redirects=False,
+                    timeout=kwargs.get("timeout"),
+                )
+            if history:
+                r.history = history
+            size = len(r.content)
+            status = r.status_code
+            return r
+        finally:
+            self.metrics.observe(
+                phase,
+                time.monotonic() - start - waited,
+                size,
+                status,
+                getattr(_retry_state, "retries", 0),
+            )
+
+    def _resume_session(self):
+        """Try to reuse a session saved in the session store.
+
+        The saved cookies are validated by fetching loginSuccessData,
+        which we need anyway. Returns True if the session is still good.
+        """
+        entry = self.session_store.load(self.user, self.country)
+        if entry is None:
+            return False
+
+        self.session = self._new_session()
+        load_cookies(self.session.cookies, entry["cookies"])
+        r = self._request(
+            "login_success",
+            "get",
+            self.urls["loginSuccessData"],
+            allow_redirects=False,
+            timeout=TIMEOUT,
+        )
+        try:
+            if r.status_code != 200:
+                raise ValueError("status %d" % r.status_code)
+            account = parse_account(r.content)
+        except (ValueError, ServerError) as e:
+            _LOGGER.debug("Cached session rejected (%s), doing full login", e)
+            self.session_store.clear(self.user, self.country)
+            return False
+
+        _LOGGER.debug("Resumed cached session")
+        self.account = account
+        return True
 
     def login(self):
         """New login path, to be used with json data path."""
+        with self._login_lock:
+            self._app_sessions = {}
+            # only set again once the login succeeds, so a failed login
+            # doesn't look logged in
+            self.account = None
+            if self.session_store is None or not self._resume_session():
+                self._full_login()
+            self.logged_in_at = time.monotonic()
+            self._login_error = None
+            self._login_generation += 1
+
+    def _relogin(self, generation):
+        """Log in again, unless another thread already did.
+
+        generation is the _login_generation the caller saw before its
+        session expired. Concurrent callers block until the one doing
+        the login is done, then all carry on with the new session, or
+        all get the error if the login failed.
+        """
+        with self._login_lock:
+            if generation != self._login_generation:
+                # someone else already tried, share how it went
+                if self._login_error is not None:
+                    raise self._login_error
+                return
+            _LOGGER.info(
+                "Session for %s expired, logging in again", self.user
+            )
+            if self.session_store is not None:
+                self.session_store.clear(self.user, self.country)
+            try:
+                self.login()
+            except Exception as e:
+                # Start a new generation anyway, so callers waiting on
+                # the lock get this error instead of each logging in.
+                self._login_error = e
+                self._login_generation += 1
+                raise
+
+    def _session_too_old(self):
+        return (
+            self.session_lifetime is not None
+            and self.logged_in_at is not None
+            and time.monotonic() - self.logged_in_at > self.session_lifetime
+        )
+
+    def _full_login(self):
         # Get the main page
-        self.session = requests.Session()
+        self.session = self._new_session()
 
         # It doesn't like an empty session so load the login page first.
-        r = self.session.get(get_url("home", self.country), timeout=TIMEOUT)
+        r = self._request(
+            "home", "get", self.urls["home"], timeout=TIMEOUT
+        )
         initial_url = urllib.parse.urlparse(r.request.url)
         nonce = urllib.parse.parse_qs(initial_url.query).get("nonce")[0]
 
@@ -267,9 +726,11 @@ class MyChevy(object):
         )
 
         # Login Request
-        r = self.session.post(
-            LOGIN_URL.format(trans_id),
-            {
+        r = self._request(
+            "self_asserted",
+            "post",
+            self.urls["self_asserted"].format(trans_id),
+            data={
                 "request_type": "RESPONSE",
                 "logonIdentifier": self.user,
                 "password": self.passwd,
@@ -280,7 +741,9 @@ class MyChevy(object):
         )
 
         # Generate Auth Code and ID Token
-        r = self.session.get(TOKEN_URL.format(csrf, trans_id))
+        r = self._request(
+            "token", "get", self.urls["token"].format(csrf, trans_id)
+        )
         r.raise_for_status()
         _LOGGER.debug("ID Token Content: %s", r.content)
         m = id_token_re.search(r.text)
@@ -290,56 +753,84 @@ class MyChevy(object):
         id_token = m.group(1)
 
         # Post ID Token
-        r = self.session.post(
-            get_url("oc_login", self.country),
-            {"id_token": id_token},
+        r = self._request(
+            "oc_login",
+            "post",
+            self.urls["oc_login"],
+            data={"id_token": id_token},
         )
         r.raise_for_status()
-        self.account = self.session.get(
-            get_url("loginSuccessData", self.country), timeout=TIMEOUT
+        r = self._request(
+            "login_success",
+            "get",
+            self.urls["loginSuccessData"],
+            timeout=TIMEOUT,
         )
+        # only the parsed account is kept, not the whole response
+        self.account = parse_account(r.content)
+        if self.session_store is not None:
+            self.session_store.save(
+                self.user, self.country, self.session.cookies
+            )
 
     def get_cars(self):
-        try:
-            data = json.loads(self.account.content.decode("utf-8"))
-            if data["serverErrorMsgs"]:
-                raise Exception(data["serverErrorMsgs"])
-
-            self.cars = []
-            _LOGGER.debug("Vehicles: %s", data["data"]["vehicleMap"])
-            for vid, vehicle in data["data"]["vehicleMap"].items():
-                self.cars.append(EVCar(vehicle))
-        except Exception:
-            raise Exception(
-                """
-Something went wrong!
-
-Cookies: %s
-
-Content: %s
-
-Location: %s
-            """
-                % (self.account.cookies, self.account.content, self.account.history)
-            )
+        """Build self.cars from the account parsed at login."""
+        if self.account is None:
+            raise ValueError("Not logged in, call login() first")
 
-    @retry(ServerError, logger=_LOGGER)
-    def _fetch_car(self, car):
-        headers = {"user-agent": USER_AGENT}
-        _LOGGER.debug("Fetching car...")
-        now = int(round(time.time() * 1000))
-        session = get_url("session", self.country).format(car.vin, car.onstar, now, KEY)
-        res = self.session.get(
-            session,
-            headers=headers,
-            cookies=self.cookies,
-            allow_redirects=False,
-            timeout=TIMEOUT,
-        )
+        _LOGGER.debug("Vehicles: %s", self.account.vehicles)
+        cars = []
+        for vehicle in self.account.vehicles:
+            # keep cars we already know, and what we know about them
+            car = self._by_vin.get(vehicle["vin"])
+            if car is None:
+                car = self._new_car(vehicle)
+            else:
+                car.set_vehicle(vehicle)
+            cars.append(car)
+
+        self.cars = cars
+        self._by_vin = {c.vin: c for c in cars}
+        self._by_vid = {c.vid: c for c in cars}
 
+    def get_car(self, vin):
+        """The car with this vin, None if the account has no such car."""
+        return self._by_vin.get(vin)
+
+    def get_car_by_id(self, vehicle_id):
+        """The car with this vehicle_id, None if there is none."""
+        return self._by_vid.get(vehicle_id)
+
+    def subscribe(self, callback):
+        """Subscribe callback to changes of every car, see EVCar.subscribe.
+
+        Cars that show up on a later get_cars are subscribed too.
+        """
+        self.subscribers.append(callback)
+        for car in self.cars:
+            car.subscribe(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+        for car in self.cars:
+            car.unsubscribe(callback)
+
+    def update_car(self, vin, max_age=None):
+        """Refresh just one car, see update_cars for max_age."""
+        car = self._by_vin.get(vin)
+        if car is None:
+            raise KeyError("No car with vin %s" % vin)
+        if max_age is None or not car.is_fresh(max_age):
+            self._fetch_car(car)
+        return car
+
+    def _get_vehicle_url(self, kind, car, headers):
         now = int(round(time.time() * 1000))
-        url = get_url("evstats", self.country).format(car.vin, car.onstar, now, KEY)
-        res = self.session.get(
+        url = self.urls[kind].format(car.vin, car.onstar, now, KEY)
+        return self._request(
+            "session_key" if kind == "session" else kind,
+            "get",
             url,
             headers=headers,
             cookies=self.cookies,
@@ -347,10 +838,195 @@ Location: %s
             timeout=TIMEOUT,
         )
 
-        _LOGGER.debug("Vehicle data: %s" % res.content)
-        car.from_json(res.content)
+    def _ensure_app_session(self, car, headers):
+        """Create an app session key for the car unless we have a valid one.
+
+        Returns True if a new key was asked for. The key is only reused
+        later if GM answered with a 2xx, a 5xx raises ServerError.
+        """
+        if self._app_sessions.get(car.vin, 0) > time.time():
+            return False
+        _LOGGER.debug("Creating app session for %s", car.vin)
+        res = self._get_vehicle_url("session", car, headers)
+        if res.status_code >= 500:
+            raise ServerError(
+                "HTTP %d from createAppSessionKey" % res.status_code
+            )
+        if not res.is_redirect and 200 <= res.status_code < 300:
+            self._app_sessions[car.vin] = time.time() + self.app_session_ttl
+        return True
+
+    @staticmethod
+    def _is_auth_failure(res):
+        return res.is_redirect or res.status_code in (401, 403)
+
+    def _new_car(self, vehicle):
+        car = EVCar(vehicle)
+        if self.history_size:
+            if car.vin not in self.history:
+                self.history[car.vin] = VehicleHistory(self.history_size)
+            car.history = self.history[car.vin]
+        car.derived = DerivedMetrics()
+        for callback in self.subscribers:
+            car.subscribe(callback)
+        return car
+
+    def _retrying(self, func, *args):
+        """Call func, retrying RETRYABLE_ERRORS per self.retry_policy.
+
+        Retries stop early when either retry budget is spent, and no
+        call is made at all while the circuit breaker is open. The
+        breaker counts a failure per call, once all its retries failed.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(
+                "Too many OnStar failures, not trying for now"
+            )
+        try:
+            result = self._retry_loop(func, args)
+        except RETRYABLE_ERRORS:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # doesn't tell us whether OnStar is up, but must not leave
+            # a trial call of a half open breaker pending forever
+            self.breaker.release()
+            raise
+        self.breaker.record_success()
+        return result
+
+    def _retry_loop(self, func, args):
+        policy = self.retry_policy
+        attempt = 0
+        outer = getattr(_retry_state, "retries", 0)
+        try:
+            while True:
+                _retry_state.retries = attempt
+                try:
+                    return func(*args)
+                except RETRYABLE_ERRORS as e:
+                    attempt += 1
+                    if attempt >= policy.tries:
+                        raise
+                    if not self._spend_retry():
+                        _LOGGER.warning("%s, retry budget exhausted", e)
+                        raise
+                    delay = policy.delay_for(attempt)
+                    _LOGGER.warning(
+                        "%s, Retrying in %.1f seconds...", e, delay
+                    )
+                    time.sleep(delay)
+        finally:
+            _retry_state.retries = outer
+
+    def _spend_retry(self):
+        """Take a retry from every budget, or from none if one is spent."""
+        spent = []
+        for budget in self.retry_budgets:
+            if not budget.acquire():
+                for b in spent:
+                    b.refund()
+                return False
+            spent.append(budget)
+        return True
 
-    def update_cars(self):
-        for c in self.cars:
+    def _fetch_car(self, car):
+        """Refresh one car.
+
+        If the car is already being refreshed by another thread, wait
+        for that refresh instead of making another one.
+        """
+        self._inflight.do(car.vin, self._refresh_car, car)
+
+    def _refresh_car(self, car):
+        start = time.monotonic()
+        generation = self._login_generation
+        if self._session_too_old():
+            _LOGGER.debug("Session is getting old, logging in again")
+            self._relogin(generation)
+            generation = self._login_generation
+        try:
+            self._retrying(self._fetch_car_once, car)
+        except SessionExpired:
+            self._relogin(generation)
+            self._retrying(self._fetch_car_once, car)
+        car.fetch_latency = time.monotonic() - start
+
+    def _fetch_car_once(self, car):
+        headers = {"user-agent": USER_AGENT}
+        _LOGGER.debug("Fetching car...")
+        created = self._ensure_app_session(car, headers)
+        res = self._get_vehicle_url("evstats", car, headers)
+
+        if self._is_auth_failure(res) and not created:
+            _LOGGER.debug("App session for %s rejected, renewing", car.vin)
+            self._app_sessions.pop(car.vin, None)
+            self._ensure_app_session(car, headers)
+            res = self._get_vehicle_url("evstats", car, headers)
+
+        _LOGGER.debug("Vehicle data: %s", res.content)
+        try:
+            if res.status_code >= 500:
+                raise ServerError("HTTP %d from evstats" % res.status_code)
+            # An expired session gets bounced to the login page, or
+            # refused even with a fresh app session key.
+            if self._is_auth_failure(res):
+                raise SessionExpired("evstats returned %d" % res.status_code)
+            # Anything else odd (404, 429, an empty body) isn't worth
+            # logging in again for.
+            if res.status_code >= 400 or not res.content.strip():
+                raise ServerError(
+                    "Unexpected %d response from evstats" % res.status_code
+                )
+            # The login page served in place of the data
+            if not _is_json(res.content):
+                raise SessionExpired("evstats returned a non JSON page")
+            car.from_json(res.content)
+        except ServerError:
+            # Don't trust the key on the retry, that's what we used to do
+            # on every fetch.
+            self._app_sessions.pop(car.vin, None)
+            raise
+
+    def snapshot(self):
+        """Current state of all cars as columns, see history.columnar."""
+        return columnar(self.cars)
+
+    def _stale_cars(self, max_age):
+        if max_age is None:
+            return list(self.cars)
+        return [c for c in self.cars if not c.is_fresh(max_age)]
+
+    def update_cars(self, max_age=None):
+        """Refresh all cars.
+
+        If max_age is given, cars refreshed less than max_age seconds ago
+        are left alone.
+        """
+        for c in self._stale_cars(max_age):
             self._fetch_car(c)
         return self.cars
+
+    def update_cars_concurrently(self, max_workers=MAX_WORKERS, max_age=None):
+        """Refresh all cars in parallel over the shared session.
+
+        Unlike update_cars, a failure on one car does not abort the
+        refresh of the others. Returns a dict of vin -> exception for
+        every car that could not be updated. max_age works as it does
+        for update_cars.
+        """
+        errors = {}
+        cars = self._stale_cars(max_age)
+        if not cars:
+            return errors
+
+        workers = max(1, min(max_workers, len(cars)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [(c, pool.submit(self._fetch_car, c)) for c in cars]
+            for car, future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    _LOGGER.warning("Failed to update %s: %s", car.vin, e)
+                    errors[car.vin] = e
+        return errors
@@ -0,0 +1,147 @@
+# Copyright 2017 Sean Dague
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Token bucket rate limiting of requests to GM, shared process wide."""
+
+import threading
+import time
+import urllib.parse
+
+# Class of endpoint of each request phase (see mychevy.Metrics), for
+# limits per endpoint rather than per host: my.chevrolet.com serves both
+# the tail of the login and the vehicle data.
+ENDPOINTS = {
+    "home": "login",
+    "self_asserted": "login",
+    "token": "login",
+    "oc_login": "login",
+    "login_success": "login",
+    "session_key": "vehicle",
+    "evstats": "vehicle",
+}
+
+
+class TokenBucket(object):
+    """Allow ``rate`` requests a second, with bursts of up to ``burst``.
+
+    Rather than failing when empty, the bucket hands out tokens from the
+    future: reserve() returns how long the caller has to wait for its
+    token. Waiting callers are so spaced exactly 1/rate apart, which
+    keeps throughput right at the limit.
+    """
+
+    def __init__(self, rate, burst=1, clock=time.monotonic):
+        super(TokenBucket, self).__init__()
+        self.rate = float(rate)
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token, returns the seconds to wait before using it."""
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+
+def _buckets(limits, clock):
+    buckets = {}
+    for key, limit in (limits or {}).items():
+        if not isinstance(limit, tuple):
+            limit = (limit, 1)
+        buckets[key] = TokenBucket(limit[0], limit[1], clock)
+    return buckets
+
+
+class RateLimiter(object):
+    """A global limit, and limits per host and per endpoint on requests.
+
+    All are off until configured. The hosts of interest are
+    custlogin.gm.com for the login steps, and my.chevrolet.com /
+    my.gm.ca for the rest of the login and the vehicle endpoints. To
+    limit the vehicle endpoints apart from the login, use the endpoint
+    classes of ENDPOINTS, "login" and "vehicle".
+    """
+
+    def __init__(self, clock=time.monotonic):
+        super(RateLimiter, self).__init__()
+        self.clock = clock
+        self.bucket = None
+        self.hosts = {}
+        self.endpoints = {}
+
+    def configure(self, rate=None, burst=1, per_host=None,
+                  per_endpoint=None):
+        """Set the limits.
+
+        Args:
+            rate: Requests per second across all hosts, None for no limit.
+            burst: Requests allowed at once when the global bucket is full.
+            per_host: Dict of host -> rate or (rate, burst).
+            per_endpoint: Dict of endpoint class (see ENDPOINTS) -> rate
+                or (rate, burst).
+        """
+        self.bucket = None
+        if rate is not None:
+            self.bucket = TokenBucket(rate, burst, self.clock)
+        self.hosts = _buckets(per_host, self.clock)
+        self.endpoints = _buckets(per_endpoint, self.clock)
+
+    def delay(self, url, phase=None):
+        """Reserve a request to url, returns the seconds to wait first.
+
+        phase is the kind of request, as reported to mychevy.Metrics,
+        which picks the endpoint limit that applies.
+        """
+        wait = 0.0
+        if self.bucket is not None:
+            wait = self.bucket.reserve()
+        if self.hosts:
+            bucket = self.hosts.get(urllib.parse.urlsplit(url).hostname)
+            if bucket is not None:
+                wait = max(wait, bucket.reserve())
+        if self.endpoints:
+            bucket = self.endpoints.get(ENDPOINTS.get(phase))
+            if bucket is not None:
+                wait = max(wait, bucket.reserve())
+        return wait
+
+    def acquire(self, url, phase=None):
+        """Block until a request to url is allowed.
+
+        Returns the seconds waited.
+        """
+        wait = self.delay(url, phase)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+# Shared by every MyChevy instance that isn't given its own limiter.
+DEFAULT_LIMITER = RateLimiter()
+
+
+def configure_rate_limit(rate=None, burst=1, per_host=None,
+                         per_endpoint=None):
+    """Configure the process wide DEFAULT_LIMITER, see RateLimiter."""
+    DEFAULT_LIMITER.configure(rate, burst, per_host, per_endpoint)
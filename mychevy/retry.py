@@ -0,0 +1,159 @@
+# Copyright 2017 Sean Dague
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Retry policy, retry budgets and circuit breakers."""
+
+import collections
+import logging
+import random
+import threading
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+# Retries allowed per account, and for the whole process, per window.
+ACCOUNT_RETRY_LIMIT = 10
+GLOBAL_RETRY_LIMIT = 100
+RETRY_WINDOW = 60
+
+# Consecutive failures before a breaker opens, and how long it stays open.
+BREAKER_THRESHOLD = 10
+BREAKER_RESET = 60
+
+
+class RetryPolicy(object):
+    """How many times to try and how long to wait in between.
+
+    Delays grow exponentially from ``delay`` up to ``max_delay``. With
+    jitter each delay is picked at random from its upper half, so cars
+    that failed together don't all retry at the same moment.
+    """
+
+    def __init__(self, tries=3, delay=3, backoff=2, max_delay=30, jitter=True):
+        super(RetryPolicy, self).__init__()
+        self.tries = tries
+        self.delay = delay
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def delay_for(self, retry):
+        """Seconds to wait before retry number ``retry`` (from 1)."""
+        base = min(self.max_delay, self.delay * self.backoff ** (retry - 1))
+        if self.jitter:
+            return random.uniform(base / 2, base)
+        return base
+
+
+class RetryBudget(object):
+    """Allow at most ``limit`` retries in any ``window`` seconds."""
+
+    def __init__(self, limit, window=RETRY_WINDOW, clock=time.monotonic):
+        super(RetryBudget, self).__init__()
+        self.limit = limit
+        self.window = window
+        self.clock = clock
+        self._spent = collections.deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Spend one retry, returns False if the budget is used up."""
+        now = self.clock()
+        with self._lock:
+            while self._spent and self._spent[0] <= now - self.window:
+                self._spent.popleft()
+            if len(self._spent) >= self.limit:
+                return False
+            self._spent.append(now)
+            return True
+
+    def refund(self):
+        """Give back the retry spent last."""
+        with self._lock:
+            if self._spent:
+                self._spent.pop()
+
+
+class CircuitBreaker(object):
+    """Stop calling a backend that keeps failing.
+
+    After ``threshold`` failures in a row the breaker opens and allow()
+    returns False for ``reset`` seconds. After that a single trial call
+    is let through: success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset=BREAKER_RESET,
+                 clock=time.monotonic):
+        super(CircuitBreaker, self).__init__()
+        self.threshold = threshold
+        self.reset = reset
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._trial or self.clock() - self.opened_at < self.reset:
+                return False
+            self._trial = True
+            return True
+
+    def release(self):
+        """End a trial call that neither succeeded nor failed.
+
+        The breaker stays open, and the next allow() after the reset
+        time lets another trial through.
+        """
+        with self._lock:
+            self._trial = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                if self.opened_at is None:
+                    _LOGGER.warning(
+                        "Opening circuit breaker after %d failures",
+                        self.failures,
+                    )
+                self.opened_at = self.clock()
+                self._trial = False
+
+
+GLOBAL_RETRY_BUDGET = RetryBudget(GLOBAL_RETRY_LIMIT)
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(name):
+    """The process wide circuit breaker for a backend, e.g. a country."""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker()
+        return _breakers[name]
@@ -0,0 +1,134 @@
+# Copyright 2017 Sean Dague
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Polling scheduler that adapts to what each car is doing."""
+
+import datetime
+import logging
+import threading
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+# Poll intervals in seconds.
+CHARGING_INTERVAL = 5 * 60
+PLUGGED_INTERVAL = 20 * 60
+UNPLUGGED_INTERVAL = 60 * 60
+MIN_INTERVAL = 60
+# How long after estimatedFullChargeBy we look again, to catch completion.
+FULL_CHARGE_GRACE = 60
+
+
+def parse_full_charge_by(value, now=None):
+    """Turn estimatedFullChargeBy ("5:00 a.m.") into a timestamp.
+
+    The value is a local wall clock time, so this returns the next time
+    after ``now`` it will be that time. Returns None if the value can't
+    be parsed.
+    """
+    if not value:
+        return None
+    if now is None:
+        now = time.time()
+
+    text = value.strip().upper().replace(".", "")
+    try:
+        clock = datetime.datetime.strptime(text, "%I:%M %p").time()
+    except ValueError:
+        return None
+
+    current = datetime.datetime.fromtimestamp(now)
+    eta = datetime.datetime.combine(current.date(), clock)
+    if eta <= current:
+        eta += datetime.timedelta(days=1)
+    return eta.timestamp()
+
+
+class PollScheduler(object):
+    """Refresh each car of a MyChevy account on its own cadence.
+
+    Charging cars are polled often, plugged in ones less, and unplugged
+    ones rarely. A charging car that will be full before its next poll
+    is instead checked just after estimatedFullChargeBy.
+    """
+
+    def __init__(
+        self,
+        page,
+        charging=CHARGING_INTERVAL,
+        plugged=PLUGGED_INTERVAL,
+        unplugged=UNPLUGGED_INTERVAL,
+        min_interval=MIN_INTERVAL,
+        clock=time.time,
+    ):
+        super(PollScheduler, self).__init__()
+        self.page = page
+        self.charging = charging
+        self.plugged = plugged
+        self.unplugged = unplugged
+        self.min_interval = min_interval
+        self.clock = clock
+        # vin -> timestamp the car is next due
+        self.due = {}
+        self._stop = threading.Event()
+
+    def next_interval(self, car, now=None):
+        if now is None:
+            now = self.clock()
+
+        if car.charging:
+            interval = self.charging
+            eta = parse_full_charge_by(car.estimatedFullChargeBy, now)
+            if eta is not None and eta - now < interval:
+                interval = eta - now + FULL_CHARGE_GRACE
+        elif car.plugged_in:
+            interval = self.plugged
+        else:
+            interval = self.unplugged
+        return max(interval, self.min_interval)
+
+    def next_due(self):
+        """Timestamp the next car needs refreshing, now if any are new."""
+        now = self.clock()
+        return min((self.due.get(c.vin, now) for c in self.page.cars),
+                   default=None)
+
+    def run_pending(self):
+        """Refresh every car that is due. Returns the cars refreshed."""
+        now = self.clock()
+        refreshed = []
+        for car in self.page.cars:
+            if self.due.get(car.vin, now) > now:
+                continue
+            try:
+                self.page._fetch_car(car)
+                refreshed.append(car)
+            except Exception as e:
+                _LOGGER.warning("Failed to update %s: %s", car.vin, e)
+            self.due[car.vin] = self.clock() + self.next_interval(car)
+            _LOGGER.debug("Next poll of %s at %s", car.vin,
+                          self.due[car.vin])
+        return refreshed
+
+    def run_forever(self):
+        """Keep polling until stop() is called."""
+        self._stop.clear()
+        while not self._stop.is_set():
+            self.run_pending()
+            due = self.next_due()
+            wait = self.min_interval if due is None else due - self.clock()
+            self._stop.wait(max(wait, 0))
+
+    def stop(self):
+        self._stop.set()
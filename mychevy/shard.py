@@ -0,0 +1,234 @@
+# Copyright 2017 Sean Dague
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Poll very many accounts from a pool of processes.
+
+Accounts are sharded across worker processes by a stable hash of the
+user, so an account always lands in the same process and its session
+stays warm there between refreshes. Each worker runs a Fleet, and sends
+one small ShardResult per car back over a queue.
+"""
+
+import collections
+import logging
+import multiprocessing
+import os
+import queue
+import time
+import zlib
+
+from mychevy.cache import SessionStore
+from mychevy.fleet import Fleet
+
+_LOGGER = logging.getLogger(__name__)
+
+# One car (or failed login) of a refresh, as sent back by a worker. car
+# is EVCar.as_dict(), None on error. vin is None if the login failed.
+ShardResult = collections.namedtuple(
+    "ShardResult", ["shard", "user", "vin", "car", "error"]
+)
+
+# sent by a worker when it has finished a round
+_DONE = "done"
+# How often, in seconds, to check on workers while waiting for results.
+POLL_INTERVAL = 1.0
+
+
+def shard_for(user, shards):
+    """The shard an account belongs to, the same in every process.
+
+    hash() is salted per process, so crc32 is used instead.
+    """
+    return zlib.crc32(user.lower().encode("utf-8")) % shards
+
+
+def shard_cache_path(path, shard):
+    """The session cache file of one shard, see ShardedFleet."""
+    return "%s.%d" % (path, shard)
+
+
+def _worker(shard, accounts, requests, results, fleet_kwargs,
+            session_cache):
+    if session_cache is not None:
+        fleet_kwargs = dict(fleet_kwargs, session_store=SessionStore(
+            shard_cache_path(session_cache, shard)))
+    fleet = Fleet(**fleet_kwargs)
+    for user, passwd, country, urls in accounts:
+        fleet.add_account(user, passwd, country, urls)
+    try:
+        while True:
+            request = requests.get()
+            if request is None:
+                return
+            round_id, max_age = request
+            for r in fleet.iter_refresh(max_age):
+                if r.error is None:
+                    result = ShardResult(shard, r.account.user, r.car.vin,
+                                         r.car.as_dict(), None)
+                else:
+                    vin = r.car.vin if r.car else None
+                    result = ShardResult(shard, r.account.user, vin, None,
+                                         str(r.error))
+                results.put((round_id, shard, result))
+            results.put((round_id, shard, _DONE))
+    finally:
+        fleet.close()
+
+
+class ShardedFleet(object):
+    """Accounts split over ``shards`` processes, each running a Fleet.
+
+    Add every account, then start(). Extra keyword arguments are passed
+    to each worker's Fleet (max_workers, keep_alive, ...), so they must
+    pickle. Sessions are cached if session_cache is the path of a
+    SessionStore. Each shard builds its own store in a file of its own,
+    named by shard_cache_path, so workers never overwrite each other's
+    sessions.
+    """
+
+    def __init__(self, shards=None, session_cache=None, **fleet_kwargs):
+        super(ShardedFleet, self).__init__()
+        if "session_store" in fleet_kwargs:
+            raise TypeError("A SessionStore can't be shared by processes, "
+                            "pass its path as session_cache instead")
+        self.shards = shards or os.cpu_count() or 1
+        self.session_cache = session_cache
+        self.fleet_kwargs = fleet_kwargs
+        self.accounts = [[] for _ in range(self.shards)]
+        self.results = None
+        self._requests = []
+        self._processes = []
+        self._round = 0
+
+    @classmethod
+    def from_config(cls, cfile, **kwargs):
+        """Build from a config with one section per account, see Fleet."""
+        fleet = cls(**kwargs)
+        for name in cfile.sections():
+            section = cfile[name]
+            if "user" in section and "passwd" in section:
+                fleet.add_account(
+                    section["user"],
+                    section["passwd"],
+                    section.get("country", "us"),
+                )
+        return fleet
+
+    def add_account(self, user, passwd, country="us", urls=None):
+        if self._processes:
+            raise RuntimeError("Accounts must be added before start()")
+        self.accounts[shard_for(user, self.shards)].append(
+            (user, passwd, country, urls))
+
+    def start(self):
+        self.results = multiprocessing.Queue()
+        self._requests = [None] * self.shards
+        self._processes = [None] * self.shards
+        for shard in range(self.shards):
+            self._start_shard(shard)
+
+    def _start_shard(self, shard):
+        requests = multiprocessing.Queue()
+        p = multiprocessing.Process(
+            target=_worker,
+            args=(shard, self.accounts[shard], requests, self.results,
+                  self.fleet_kwargs, self.session_cache),
+            name="mychevy-shard-%d" % shard,
+            daemon=True,
+        )
+        p.start()
+        self._requests[shard] = requests
+        self._processes[shard] = p
+
+    def _restart_dead(self, shards):
+        """Restart the dead workers among shards, returns their results.
+
+        The results are an error ShardResult per dead worker, as its
+        accounts weren't refreshed this round.
+        """
+        dead = []
+        for shard in sorted(shards):
+            p = self._processes[shard]
+            if p.is_alive():
+                continue
+            p.join()
+            _LOGGER.warning("%s died with exit code %s, restarting",
+                            p.name, p.exitcode)
+            self._start_shard(shard)
+            dead.append(ShardResult(shard, None, None, None,
+                                    "worker died (exit code %s)"
+                                    % p.exitcode))
+        return dead
+
+    def iter_refresh(self, max_age=None, timeout=None):
+        """Refresh every shard, yielding ShardResults as they arrive.
+
+        Shards work independently, so a slow or stuck one only delays
+        its own accounts. With a timeout, gives up waiting on shards
+        that aren't done after that many seconds; their late results are
+        dropped rather than mixed into the next refresh. A worker that
+        dies yields one ShardResult with an error and no user for its
+        shard, and is restarted for the next refresh.
+        """
+        self._round += 1
+        for requests in self._requests:
+            requests.put((self._round, max_age))
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        pending = set(range(self.shards))
+        while pending:
+            wait = POLL_INTERVAL
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    _LOGGER.warning("%d shards didn't finish in %ss",
+                                    len(pending), timeout)
+                    return
+                wait = min(wait, remaining)
+            try:
+                round_id, shard, result = self.results.get(timeout=wait)
+            except queue.Empty:
+                for result in self._restart_dead(pending):
+                    pending.discard(result.shard)
+                    yield result
+                continue
+            if round_id != self._round:
+                continue
+            if result == _DONE:
+                pending.discard(shard)
+            else:
+                yield result
+
+    def refresh_all(self, max_age=None, timeout=None):
+        return list(self.iter_refresh(max_age, timeout))
+
+    def close(self, timeout=None):
+        """Stop the workers, killing any still busy after timeout."""
+        for requests in self._requests:
+            requests.put(None)
+        for p in self._processes:
+            p.join(timeout)
+            if p.is_alive():
+                _LOGGER.warning("Terminating stuck %s", p.name)
+                p.terminate()
+                p.join()
+        self._requests = []
+        self._processes = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,127 @@
+# Copyright 2017 Sean Dague
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Stream car state as JSON Lines, refreshing on an interval."""
+
+import collections
+import json
+import logging
+import threading
+import time
+
+from mychevy.mychevy import MAX_WORKERS
+
+_LOGGER = logging.getLogger(__name__)
+
+WATCH_INTERVAL = 5 * 60
+# Records held for a slow reader before the oldest are dropped.
+BUFFER_SIZE = 1000
+
+
+class JsonLinesWriter(object):
+    """Write records to a file from a background thread.
+
+    At most ``buffer_size`` records are held while the file is slow to
+    take them. Past that the oldest are dropped (and counted in
+    ``dropped``) so a stalled reader can't stall polling or grow memory.
+
+    If writing fails (e.g. the reader went away) the error is kept in
+    ``error`` and raised from the next put(), or from close().
+    """
+
+    def __init__(self, out, buffer_size=BUFFER_SIZE):
+        super(JsonLinesWriter, self).__init__()
+        self.out = out
+        self.dropped = 0
+        self.error = None
+        self._reported = False
+        self._buffer = collections.deque(maxlen=buffer_size)
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _raise_error(self):
+        self._reported = True
+        raise self.error
+
+    def put(self, record):
+        with self._cond:
+            if self.error is not None:
+                self._raise_error()
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+            self._buffer.append(record)
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._buffer and not self._closed:
+                    self._cond.wait()
+                if not self._buffer:
+                    return
+                records = list(self._buffer)
+                self._buffer.clear()
+            try:
+                for record in records:
+                    self.out.write(json.dumps(record) + "\n")
+                self.out.flush()
+            except Exception as e:
+                with self._cond:
+                    self.error = e
+                    self._buffer.clear()
+                return
+
+    def close(self):
+        """Write out whatever is buffered and stop."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        if self.dropped:
+            _LOGGER.warning(
+                "Dropped %d records, reader too slow", self.dropped
+            )
+        if self.error is not None and not self._reported:
+            self._raise_error()
+
+
+def watch(page, writer, interval=WATCH_INTERVAL, count=None, stop=None,
+          max_workers=MAX_WORKERS):
+    """Refresh page's cars every interval, writing a record per car.
+
+    page must already be logged in. Each record is EVCar.as_dict() plus
+    the time it was written, or the vin and an error if that car failed
+    to refresh. Stops after ``count`` refreshes, when the ``stop``
+    event is set, or by raising the writer's error if writing failed.
+    """
+    if stop is None:
+        stop = threading.Event()
+    refreshes = 0
+    while not stop.is_set():
+        errors = page.update_cars_concurrently(max_workers=max_workers)
+        now = time.time()
+        for car in page.cars:
+            if car.vin in errors:
+                record = {"vin": car.vin, "error": str(errors[car.vin])}
+            else:
+                record = car.as_dict()
+            record["timestamp"] = now
+            writer.put(record)
+
+        refreshes += 1
+        if count is not None and refreshes >= count:
+            break
+        stop.wait(interval)
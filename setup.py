@@ -22,6 +22,11 @@ setup_requirements = [
     # TODO(sdague): put setup requirements (distutils extensions, etc.) here
 ]
 
+extras_requirements = {
+    'async': ['aiohttp'],
+    'fast': ['orjson'],
+}
+
 test_requirements = [
     'pytest',
     # TODO: put package test requirements here
@@ -45,6 +50,7 @@ setup(
     },
     include_package_data=True,
     install_requires=requirements,
+    extras_require=extras_requirements,
     license="Apache Software License 2.0",
     zip_safe=False,
     keywords='mychevy',
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+
+"""A local stand in for the GM login and OnStar vehicle endpoints.
+
+FakeGM runs an HTTP server on localhost that walks through the same
+steps as the real B2C login, serves loginSuccessData with any number of
+vehicles, and answers createAppSessionKey and evstats. Latency and
+failures can be injected to exercise retries and to benchmark::
+
+    with FakeGM(vehicles=3, latency=0.05) as gm:
+        page = MyChevy("me@example.com", "secret", urls=gm.urls)
+        page.login()
+"""
+
+import collections
+from http import cookies
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import threading
+import time
+import urllib.parse
+import uuid
+
+SERVER_ERROR = b'{"messages":[],"serverErrorMsgs":[],"data":"SERVER ERROR"}'
+
+
+def vehicle(n):
+    return {
+        "vin": "FAKEVIN%010d" % n,
+        "vehicle_id": str(1000 + n),
+        "onstarAccountNumber": str(5000 + n),
+        "year": "2017",
+        "make": "Chevrolet",
+        "model": "Bolt EV",
+        "imageUrl": "",
+    }
+
+
+def evstats(n, now=None):
+    if now is None:
+        now = time.time()
+    return {
+        "messages": [],
+        "serverErrorMsgs": [],
+        "data": {
+            "dataAsOfDate": int(now * 1000),
+            "batteryLevel": 50 + n % 50,
+            "chargeState": "charging" if n % 2 else "not_charging",
+            "plugState": "plugged" if n % 2 else "unplugged",
+            "rateType": "PEAK",
+            "voltage": 240 if n % 2 else 0,
+            "electricRange": 120 + n % 100,
+            "totalRange": 120 + n % 100,
+            "chargeMode": "IMMEDIATE",
+            "electricMiles": 1000 + n,
+            "gasMiles": 0,
+            "totalMiles": 1000 + n,
+            "percentageOnElectric": 1,
+            "fuelEconomy": 1000,
+            "electricEconomy": 45,
+            "combinedEconomy": 11,
+            "fuelUsed": 132,
+            "electricityUsed": 132,
+            "estimatedGallonsFuelSaved": 61.13,
+            "estimatedCO2Avoided": 1185.92,
+            "estimatedFullChargeBy": "5:00 a.m.",
+        },
+    }
+
+
+class FakeGM(object):
+    """The fake server, start() it or use it as a context manager.
+
+    Args:
+        vehicles: Number of vehicles on every account.
+        latency: Seconds every request takes.
+        error_rate: Fraction of evstats requests answered with a 503.
+        server_error_rate: Fraction of evstats requests answered with
+            a "SERVER ERROR" payload.
+        session_lifetime: Seconds a login session is valid for, None
+            for forever.
+        login_page: Answer requests without a valid session with a 200
+            login page, rather than a redirect to it.
+    """
+
+    def __init__(self, vehicles=1, latency=0, error_rate=0,
+                 server_error_rate=0, session_lifetime=None,
+                 login_page=False):
+        self.vehicles = vehicles
+        self.latency = latency
+        self.error_rate = error_rate
+        self.server_error_rate = server_error_rate
+        self.session_lifetime = session_lifetime
+        self.login_page = login_page
+        # path, or createAppSessionKey / evstats -> number of requests
+        self.requests = collections.Counter()
+        # session cookie -> (user, expiry)
+        self.sessions = {}
+        # transaction id -> user that passed the SelfAsserted step
+        self.transactions = {}
+        self.server = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def base(self):
+        host, port = self.server.server_address[:2]
+        return "http://%s:%d" % (host, port)
+
+    @property
+    def urls(self):
+        base = self.base
+        return {
+            "home": base + "/home",
+            "self_asserted": base + "/SelfAsserted?tx={}",
+            "token": base + "/confirmed?csrf_token={}&tx={}",
+            "oc_login": base + "/oc_login",
+            "loginSuccessData": base + "/api/init/loginSuccessData",
+            "session": (base + "/vehicleProfile/"
+                        "{0}/{1}/createAppSessionKey?cb={2}.{3}"),
+            "evstats": (base + "/api/vehicleProfile/"
+                        "{0}/{1}/evstats/false?cb={2}.{3}"),
+        }
+
+    def start(self):
+        fake = self
+
+        class Handler(FakeGMHandler):
+            gm = fake
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def count(self, kind):
+        with self._lock:
+            self.requests[kind] += 1
+
+    def expire_sessions(self):
+        with self._lock:
+            self.sessions.clear()
+
+    def user_for(self, cookie):
+        with self._lock:
+            user, expires = self.sessions.get(cookie, (None, 0))
+        if expires is not None and expires < time.time():
+            return None
+        return user
+
+    def new_session(self, user):
+        cookie = uuid.uuid4().hex
+        expires = None
+        if self.session_lifetime is not None:
+            expires = time.time() + self.session_lifetime
+        with self._lock:
+            self.sessions[cookie] = (user, expires)
+        return cookie
+
+
+class FakeGMHandler(BaseHTTPRequestHandler):
+    gm = None
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately on a kept alive
+    # connection, which Nagle's algorithm would hold up ~40ms a response.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b"", content_type="application/json",
+              headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _redirect(self, location, headers=()):
+        self._send(302, headers=(("Location", location),) + tuple(headers))
+
+    def _form(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length).decode("utf-8")
+        return dict(urllib.parse.parse_qsl(body))
+
+    def _user(self):
+        jar = cookies.SimpleCookie(self.headers.get("Cookie", ""))
+        if "session" not in jar:
+            return None
+        return self.gm.user_for(jar["session"].value)
+
+    def _route(self, method):
+        url = urllib.parse.urlparse(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        parts = url.path.strip("/").split("/")
+        if parts[-1] == "createAppSessionKey":
+            self.gm.count("createAppSessionKey")
+        elif parts[-2:] == ["evstats", "false"]:
+            self.gm.count("evstats")
+        else:
+            self.gm.count(url.path)
+        if self.gm.latency:
+            time.sleep(self.gm.latency)
+
+        if method == "GET" and url.path == "/home":
+            return self._redirect("/authorize?nonce=%s" % uuid.uuid4().hex)
+        if method == "GET" and url.path == "/authorize":
+            settings = json.dumps({"csrf": "fakecsrf",
+                                   "transId": uuid.uuid4().hex})
+            page = "<script>var SETTINGS = %s;</script>" % settings
+            return self._send(200, page.encode(), "text/html")
+        if method == "POST" and url.path == "/SelfAsserted":
+            form = self._form()
+            if (self.headers.get("X-CSRF-TOKEN") != "fakecsrf"
+                    or not form.get("password")):
+                return self._send(400, b'{"status":"400"}')
+            self.gm.transactions[query["tx"]] = form["logonIdentifier"]
+            return self._send(200, b'{"status":"200"}')
+        if method == "GET" and url.path == "/confirmed":
+            user = self.gm.transactions.pop(query.get("tx"), None)
+            if user is None:
+                return self._send(401, b"", "text/html")
+            token = "token-%s" % urllib.parse.quote(user)
+            page = ("<form><input type='hidden' name='id_token' "
+                    "id='id_token' value='%s'/></form>" % token)
+            return self._send(200, page.encode(), "text/html")
+        if method == "POST" and url.path == "/oc_login":
+            token = self._form().get("id_token", "")
+            if not token.startswith("token-"):
+                return self._send(401, b"", "text/html")
+            user = urllib.parse.unquote(token[len("token-"):])
+            cookie = self.gm.new_session(user)
+            return self._send(200, b"<html></html>", "text/html", headers=(
+                ("Set-Cookie", "session=%s; Path=/" % cookie),))
+
+        if self._user() is None:
+            if self.gm.login_page:
+                return self._send(200, b"<html>Sign in</html>", "text/html")
+            return self._redirect("/home")
+
+        if method == "GET" and url.path == "/api/init/loginSuccessData":
+            vehicles = {str(1000 + n): vehicle(n)
+                        for n in range(self.gm.vehicles)}
+            body = {"messages": [], "serverErrorMsgs": [],
+                    "data": {"vehicleMap": vehicles}}
+            return self._send(200, json.dumps(body).encode())
+        if method == "GET" and parts[-1] == "createAppSessionKey":
+            return self._send(200, b'{"messages":[],"data":{}}')
+        if method == "GET" and parts[-2:] == ["evstats", "false"]:
+            vin = parts[-4]
+            if not vin.startswith("FAKEVIN"):
+                return self._send(404, b"", "text/html")
+            n = int(vin[len("FAKEVIN"):])
+            roll = random.random()
+            if roll < self.gm.error_rate:
+                return self._send(503, b"", "text/html")
+            if roll < self.gm.error_rate + self.gm.server_error_rate:
+                return self._send(200, SERVER_ERROR)
+            return self._send(200, json.dumps(evstats(n)).encode())
+        return self._send(404, b"", "text/html")
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `mychevy.aio` module."""
+
+import asyncio
+import unittest
+
+import pytest
+
+from mychevy.mychevy import EVCar, ServerError
+from tests.test_mychevy import CAR1, CAR2, PKT1
+
+aio = pytest.importorskip("mychevy.aio")
+
+
+class TestAsyncMyChevy(unittest.TestCase):
+
+    def test_async_retry(self):
+        calls = []
+
+        @aio.async_retry(ServerError, tries=3, delay=0)
+        async def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise ServerError("try again")
+            return "ok"
+
+        assert asyncio.run(flaky()) == "ok"
+        assert len(calls) == 3
+
+    def test_update_cars_concurrently(self):
+        page = aio.AsyncMyChevy("user", "passwd")
+        page.cars = [EVCar(CAR1), EVCar(CAR2)]
+
+        async def fetch(car):
+            if car.vin == "othervin":
+                raise ServerError("boom")
+            car.from_json(PKT1)
+
+        page._fetch_car = fetch
+        errors = asyncio.run(page.update_cars_concurrently(max_workers=2))
+
+        assert list(errors) == ["othervin"]
+        assert page.cars[0].batteryLevel == 70
+
+    def test_changes(self):
+        page = aio.AsyncMyChevy("user", "passwd")
+        page.cars = [EVCar(CAR1)]
+
+        async def run():
+            changes = page.changes()
+            pending = asyncio.ensure_future(changes.__anext__())
+            await asyncio.sleep(0)
+            page.cars[0].from_json(PKT1)
+            event = await pending
+            await changes.aclose()
+            return event
+
+        event = asyncio.run(run())
+        assert event.car is page.cars[0]
+        assert event.changes["batteryLevel"] == ("", 70)
+        assert page.subscribers == []
+        assert page.cars[0].subscribers == []
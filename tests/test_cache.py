@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `mychevy.cache` module."""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+
+from mychevy.cache import SessionStore
+from mychevy.mychevy import MyChevy
+
+ACCOUNT = b'{"messages":[],"serverErrorMsgs":[],"data":{"vehicleMap":{}}}'
+
+
+class TestSessionStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "sessions.json")
+        self.addCleanup(self.tmp.cleanup)
+
+    def _jar(self):
+        jar = requests.cookies.RequestsCookieJar()
+        jar.set("JSESSIONID", "abc", domain="my.chevrolet.com", path="/")
+        return jar
+
+    def test_roundtrip(self):
+        store = SessionStore(self.path)
+        store.save("me@example.com", "us", self._jar())
+
+        assert os.stat(self.path).st_mode & 0o777 == 0o600
+        entry = store.load("me@example.com", "us")
+        assert entry["cookies"][0]["value"] == "abc"
+        assert store.load("me@example.com", "ca") is None
+
+        store.clear("me@example.com", "us")
+        assert store.load("me@example.com", "us") is None
+
+    def test_expired(self):
+        store = SessionStore(self.path, max_age=-1)
+        store.save("me@example.com", "us", self._jar())
+        assert store.load("me@example.com", "us") is None
+
+    def test_login_resumes_session(self):
+        store = SessionStore(self.path)
+        store.save("me@example.com", "us", self._jar())
+        page = MyChevy("me@example.com", "passwd", session_store=store)
+
+        session = requests.Session()
+        response = mock.Mock(status_code=200, content=ACCOUNT)
+        with mock.patch.object(page, "_new_session", return_value=session), \
+                mock.patch.object(session, "get", return_value=response):
+            page.login()
+
+        assert page.account.vehicles == ()
+        assert session.cookies["JSESSIONID"] == "abc"
+
+    def test_rejected_session_is_cleared(self):
+        store = SessionStore(self.path)
+        store.save("me@example.com", "us", self._jar())
+        page = MyChevy("me@example.com", "passwd", session_store=store)
+
+        response = mock.Mock(status_code=302, content=b"")
+        with mock.patch.object(requests.Session, "get",
+                               return_value=response):
+            assert page._resume_session() is False
+
+        assert store.load("me@example.com", "us") is None
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `mychevy.cassette` module."""
+
+import gzip
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from mychevy.cassette import (
+    Cassette,
+    CassetteError,
+    RecordingAdapter,
+    ReplayAdapter,
+)
+from mychevy.mychevy import MyChevy
+from tests.fakegm import FakeGM
+
+USER = "someone@example.com"
+PASSWD = "hunter2"
+
+
+class TestCassette(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = os.path.join(self.tmp, "session.json.gz")
+
+    def record(self, latency=0):
+        cassette = Cassette()
+        with FakeGM(vehicles=2, latency=latency) as gm:
+            urls = gm.urls
+            page = MyChevy(USER, PASSWD, urls=urls,
+                           adapter=RecordingAdapter(cassette, [USER, PASSWD]))
+            page.login()
+            page.get_cars()
+            page.update_cars()
+        cassette.save(self.path)
+        return urls, page
+
+    def test_record_replay(self):
+        urls, recorded = self.record()
+
+        cassette = Cassette.load(self.path)
+        # home redirect, authorize, SelfAsserted, confirmed, oc_login,
+        # loginSuccessData, then createAppSessionKey + evstats per car
+        assert len(cassette) == 10
+
+        page = MyChevy("user", "passwd", urls=urls,
+                       adapter=ReplayAdapter(cassette))
+        page.login()
+        page.get_cars()
+        page.update_cars()
+        assert [c.as_dict()["batteryLevel"] for c in page.cars] == [
+            c.as_dict()["batteryLevel"] for c in recorded.cars]
+        assert [c.vin for c in page.cars] == [c.vin for c in recorded.cars]
+
+        with self.assertRaises(CassetteError):
+            page.update_cars()
+
+    def test_recorded_latency(self):
+        urls, _ = self.record(latency=0.05)
+        cassette = Cassette.load(self.path)
+        assert all(i["latency"] >= 0.05 for i in cassette.interactions)
+
+        page = MyChevy("user", "passwd", urls=urls,
+                       adapter=ReplayAdapter(cassette, latency=1))
+        page.session = page._new_session()
+        start = time.monotonic()
+        page.session.get(urls["loginSuccessData"])
+        assert time.monotonic() - start >= 0.05
+
+    def test_scrubbed(self):
+        self.record()
+        with gzip.open(self.path, "rt") as f:
+            text = f.read()
+        assert USER not in text
+        assert "someone%40example.com" not in text
+        assert PASSWD not in text
+        assert "fakecsrf" not in text
+        assert "token-" not in text
+        assert "SCRUBBED" in text
+
+    def test_replay_any_order(self):
+        urls, _ = self.record()
+        adapter = ReplayAdapter(Cassette.load(self.path))
+        page = MyChevy("user", "passwd", urls=urls, adapter=adapter)
+        page.session = page._new_session()
+
+        r = page.session.get(urls["loginSuccessData"])
+        assert b"vehicleMap" in r.content
+        with self.assertRaises(CassetteError):
+            page.session.get(urls["loginSuccessData"])
+        with self.assertRaises(CassetteError):
+            page.session.get(urls["home"].replace("/home", "/unknown"))
+
+        adapter.rewind()
+        page.login()
+        page.get_cars()
+        errors = page.update_cars_concurrently(max_workers=2)
+        assert errors == {}
+        assert all(c.dataAsOfDate is not None for c in page.cars)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `mychevy.daemon` module."""
+
+import json
+import os
+import socket
+import tempfile
+import time
+import unittest
+
+from click.testing import CliRunner
+
+from mychevy import cli
+from mychevy.daemon import Daemon, query
+from mychevy.fleet import Fleet
+from tests.fakegm import FakeGM
+
+
+class TestDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.gm = FakeGM(vehicles=2).start()
+        self.addCleanup(self.gm.stop)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.socket = os.path.join(tmp.name, "mychevy.sock")
+
+        self.fleet = Fleet(max_workers=2)
+        self.addCleanup(self.fleet.close)
+        page = self.fleet.add_account("me@example.com", "secret")
+        page.urls = self.gm.urls
+
+    def _wait_for_refresh(self):
+        for _ in range(100):
+            response = query({"cmd": "cars"}, self.socket)
+            if response["last_refresh"]:
+                return response
+            time.sleep(0.05)
+        self.fail("daemon never refreshed")
+
+    def test_serve_and_query(self):
+        daemon = Daemon(self.fleet, self.socket, interval=3600)
+        daemon.start()
+        self.addCleanup(daemon.stop)
+
+        response = self._wait_for_refresh()
+        assert [c["vin"] for c in response["cars"]] == [
+            "FAKEVIN0000000000", "FAKEVIN0000000001"]
+        assert response["errors"] == {}
+
+        # queries are served from the cache, not from GM
+        evstats = self.gm.requests["evstats"]
+        response = query({"cmd": "car", "vin": "FAKEVIN0000000001"},
+                         self.socket)
+        assert response["car"]["chargeState"] == "charging"
+        assert self.gm.requests["evstats"] == evstats
+
+        assert not query({"cmd": "car", "vin": "nope"}, self.socket)["ok"]
+        assert not query({"cmd": "bogus"}, self.socket)["ok"]
+
+    def test_socket_ownership(self):
+        # a dead daemon's socket is replaced
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.socket)
+        stale.close()
+
+        daemon = Daemon(self.fleet, self.socket, interval=3600)
+        daemon.start()
+        self.addCleanup(daemon.stop)
+        assert os.stat(self.socket).st_mode & 0o777 == 0o600
+
+        # but a running one isn't taken over
+        with self.assertRaises(RuntimeError):
+            Daemon(self.fleet, self.socket, interval=3600).start()
+        assert query({"cmd": "cars"}, self.socket)["ok"]
+
+    def test_query_cli(self):
+        daemon = Daemon(self.fleet, self.socket, interval=3600)
+        daemon.start()
+        self.addCleanup(daemon.stop)
+        self._wait_for_refresh()
+
+        result = CliRunner().invoke(cli.main, ["query", "--socket",
+                                               self.socket])
+        assert result.exit_code == 0
+        cars = [json.loads(line) for line in result.output.splitlines()]
+        assert len(cars) == 2
+
+    def test_query_cli_no_daemon(self):
+        result = CliRunner().invoke(cli.main, ["query", "--socket",
+                                               self.socket])
+        assert result.exit_code == 1
+        assert "Can't reach daemon" in result.output
+
+    def test_default_command_needs_config(self):
+        result = CliRunner().invoke(cli.main, [])
+        assert result.exit_code == 2
+        assert "--config" in result.output
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `mychevy.derived` module."""
+
+import json
+import math
+import unittest
+
+from mychevy import derived, history
+from mychevy.derived import DerivedMetrics, derive, summarize
+from mychevy.history import VehicleHistory
+from mychevy.mychevy import EVCar
+from tests.test_mychevy import CAR1
+
+HOUR = 3600
+
+
+def snapshot(car, t, battery, erange, miles, state="charging", eta=""):
+    data = {"dataAsOfDate": int(t * 1000), "plugState": "plugged",
+            "batteryLevel": battery, "electricRange": erange,
+            "totalMiles": miles, "chargeState": state,
+            "estimatedFullChargeBy": eta}
+    return car.from_json(json.dumps({"serverErrorMsgs": [], "data": data}))
+
+
+class TestDerived(unittest.TestCase):
+
+    def setUp(self):
+        self.car = EVCar(CAR1)
+        self.car.history = VehicleHistory(10)
+        self.car.derived = DerivedMetrics()
+
+    def test_charging(self):
+        snapshot(self.car, 0, 50, 100, 1000)
+        assert self.car.derived.charge_rate is None
+        snapshot(self.car, HOUR / 2, 55, 110, 1000)
+
+        d = self.car.derived
+        assert d.charge_rate == 10
+        assert d.range_rate == 20
+        assert d.time_to_full == 4.5 * HOUR
+        assert d.eta_skew is None
+        assert self.car.as_dict()["derived"]["charge_rate"] == 10
+
+        # repeated data changes nothing
+        snapshot(self.car, HOUR / 2, 55, 110, 1000)
+        assert d.charge_rate == 10
+
+        snapshot(self.car, HOUR, 60, 120, 1000, "not_charging")
+        assert d.charge_rate is None
+        assert d.time_to_full is None
+
+    def test_eta_cross_check(self):
+        snapshot(self.car, 0, 50, 100, 1000)
+        snapshot(self.car, HOUR, 60, 120, 1000, eta="5:00 a.m.")
+        d = self.car.derived
+        eta = derived.parse_full_charge_by("5:00 a.m.", HOUR)
+        assert d.time_to_full == eta - HOUR
+        assert d.eta_skew == 4 * HOUR - d.time_to_full
+
+    def test_miles_per_day(self):
+        day = 24 * HOUR
+        snapshot(self.car, 0, 50, 100, 1000, "not_charging")
+        snapshot(self.car, day, 50, 100, 1040, "not_charging")
+        assert self.car.derived.miles_per_day == 40
+        snapshot(self.car, 2 * day, 50, 100, 1040, "not_charging")
+        alpha = 1 - math.exp(-day / derived.MILES_TAU)
+        assert self.car.derived.miles_per_day == 40 - alpha * 40
+
+    def test_summarize(self):
+        for i, battery in enumerate((50, 55, 60, 60)):
+            state = "charging" if i < 3 else "not_charging"
+            snapshot(self.car, i * HOUR, battery, 2 * battery, 1000 + i * 10,
+                     state)
+
+        columns = derive(self.car.history)
+        assert list(columns["charge_rate"][:2]) == [5, 5]
+        assert math.isnan(columns["charge_rate"][2])
+        assert list(columns["miles_per_day"]) == [240] * 3
+
+        summary = summarize(self.car.history)
+        assert summary == {"charge_rate": 5, "range_rate": 10,
+                           "miles_per_day": 240}
+        summary = summarize(self.car.history, window=HOUR)
+        assert summary["charge_rate"] is None
+        assert summary["miles_per_day"] == 240
+
+    def test_summarize_without_numpy(self):
+        self.addCleanup(setattr, derived, "np", derived.np)
+        self.addCleanup(setattr, history, "np", history.np)
+        derived.np = history.np = None
+        for i, battery in enumerate((50, 55, 60)):
+            snapshot(self.car, i * HOUR, battery, 2 * battery, 1000)
+        assert summarize(self.car.history) == {
+            "charge_rate": 5, "range_rate": 10, "miles_per_day": 0}
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""End to end tests of MyChevy against the fake GM server."""
+
+import unittest
+
+from mychevy.mychevy import MyChevy, ServerError
+from mychevy.retry import CircuitBreaker, RetryPolicy
+from tests.fakegm import FakeGM
+
+
+class TestEndToEnd(unittest.TestCase):
+
+    def setUp(self):
+        self.gm = FakeGM(vehicles=3).start()
+        self.addCleanup(self.gm.stop)
+
+    def _page(self, **kwargs):
+        return MyChevy(
+            "me@example.com",
+            "secret",
+            urls=self.gm.urls,
+            breaker=CircuitBreaker(),
+            retry_policy=RetryPolicy(delay=0.01),
+            **kwargs
+        )
+
+    def test_login_and_update(self):
+        page = self._page()
+        page.login()
+        page.get_cars()
+        assert len(page.cars) == 3
+
+        page.update_cars()
+        page.update_cars()
+        assert page.cars[1].charging
+        assert page.cars[1].batteryLevel == 51
+        assert self.gm.requests["createAppSessionKey"] == 3
+        assert self.gm.requests["evstats"] == 6
+
+    def test_server_errors(self):
+        self.gm.server_error_rate = 1
+        page = self._page()
+        page.login()
+        page.get_cars()
+
+        errors = page.update_cars_concurrently()
+        assert sorted(errors) == sorted(c.vin for c in page.cars)
+        assert all(isinstance(e, ServerError) for e in errors.values())
+        assert self.gm.requests["evstats"] == 9
+
+    def test_not_found_is_not_expiry(self):
+        page = self._page()
+        page.retry_policy = RetryPolicy(tries=1)
+        page.login()
+        page.get_cars()
+        car = page.cars[0]
+        car.vin = "UNKNOWNVIN"
+
+        for _ in range(3):
+            with self.assertRaises(ServerError):
+                page._fetch_car(car)
+        assert self.gm.requests["/oc_login"] == 1
+
+    def test_expired_session_relogin(self):
+        page = self._page()
+        page.login()
+        page.get_cars()
+        page.update_cars()
+        assert self.gm.requests["/oc_login"] == 1
+
+        self.gm.expire_sessions()
+        errors = page.update_cars_concurrently(max_workers=3)
+        assert errors == {}
+        # one coordinated login, not one per car
+        assert self.gm.requests["/oc_login"] == 2
+        assert all(c.batteryLevel for c in page.cars)
+
+    def test_login_page_relogin(self):
+        page = self._page()
+        page.login()
+        page.get_cars()
+        page.update_cars()
+
+        # served the login page with a 200 rather than redirected to it
+        self.gm.login_page = True
+        self.gm.expire_sessions()
+        page.update_car(page.cars[0].vin)
+        assert self.gm.requests["/oc_login"] == 2
+
+    def test_proactive_relogin(self):
+        page = self._page(session_lifetime=60)
+        page.login()
+        page.get_cars()
+        page.update_cars()
+        assert self.gm.requests["/oc_login"] == 1
+
+        page.logged_in_at -= 61
+        page.update_cars()
+        assert self.gm.requests["/oc_login"] == 2
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `mychevy.fleet` module."""
+
+import configparser
+import unittest
+
+from mychevy.fleet import Fleet
+from mychevy.mychevy import Account, EVCar, ServerError
+from tests.test_mychevy import CAR1, CAR2, PKT1
+
+CONFIG = """
+[default]
+user = one@example.com
+passwd = secret
+
+[canada]
+user = two@example.com
+passwd = secret
+country = ca
+
+[other]
+setting = ignored
+"""
+
+
+def fake_login(page, cars):
+    def login():
+        # like the real login, the session is there before it can fail
+        page.account = None
+        page.session = page._new_session()
+        if not cars:
+            raise ValueError("bad password")
+        page.account = Account(tuple(cars))
+
+    def get_cars():
+        page.cars = [EVCar(c) for c in cars]
+
+    def fetch(car):
+        if car.vin == "othervin":
+            raise ServerError("boom")
+        car.from_json(PKT1)
+
+    page.login = login
+    page.get_cars = get_cars
+    page._fetch_car = fetch
+
+
+class TestFleet(unittest.TestCase):
+
+    def test_from_config(self):
+        cfile = configparser.ConfigParser()
+        cfile.read_string(CONFIG)
+        fleet = Fleet.from_config(cfile, max_workers=2)
+        self.addCleanup(fleet.close)
+
+        assert [p.user for p in fleet.accounts] == [
+            "one@example.com", "two@example.com"]
+        assert fleet.accounts[1].country == "ca"
+        assert fleet.accounts[0].adapter is fleet.accounts[1].adapter
+
+    def test_refresh_all(self):
+        fleet = Fleet(max_workers=2)
+        self.addCleanup(fleet.close)
+        good = fleet.add_account("one@example.com", "secret")
+        bad = fleet.add_account("two@example.com", "wrong")
+        fake_login(good, [CAR1, CAR2])
+        fake_login(bad, [])
+
+        results = fleet.refresh_all()
+        outcome = {(r.account.user, r.car and r.car.vin): r.error
+                   for r in results}
+
+        assert len(results) == 3
+        assert outcome[("one@example.com", "fakevin")] is None
+        assert isinstance(outcome[("one@example.com", "othervin")],
+                          ServerError)
+        assert isinstance(outcome[("two@example.com", None)], ValueError)
+        assert fleet.cars[0].batteryLevel == 70
+
+        # logged in accounts are not logged in again, failed ones are
+        good.login = None
+        results = fleet.refresh_all(max_age=60)
+        assert sorted((r.account.user, r.car and r.car.vin)
+                      for r in results) == [
+            ("one@example.com", "othervin"), ("two@example.com", None)]
+
+        # and once their login works they are refreshed again
+        fake_login(bad, [dict(CAR1, vin="thirdvin", vehicle_id="789")])
+        results = fleet.refresh_all(max_age=60)
+        assert sorted((r.account.user, r.car and r.car.vin)
+                      for r in results) == [
+            ("one@example.com", "othervin"), ("two@example.com", "thirdvin")]
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `mychevy.history` module."""
+
+import json
+import unittest
+
+from mychevy.history import VehicleHistory
+from mychevy.mychevy import EVCar, MyChevy, parse_account
+from tests.test_mychevy import CAR1, PKT1
+
+
+class TestVehicleHistory(unittest.TestCase):
+
+    def test_from_json_appends(self):
+        car = EVCar(CAR1)
+        car.history = VehicleHistory(4)
+        car.from_json(PKT1)
+
+        assert len(car.history) == 1
+        snap = car.history.latest()
+        assert snap["timestamp"] == 1516671611.0
+        assert snap["batteryLevel"] == 70
+        assert snap["chargeState"] == "not_charging"
+        assert snap["estimatedFullChargeBy"] == "5:00 a.m."
+        assert snap["gasRange"] == 0
+
+    def test_ring_buffer(self):
+        car = EVCar(CAR1)
+        hist = VehicleHistory(3)
+        for level in range(5):
+            car.batteryLevel = level
+            car.chargeState = "charging" if level % 2 else "not_charging"
+            hist.append(car)
+
+        assert len(hist) == 3
+        assert hist.column("batteryLevel") == [2, 3, 4]
+        assert hist.column("chargeState") == [
+            "not_charging", "charging", "not_charging"]
+        assert [s["batteryLevel"] for s in hist.snapshots()] == [2, 3, 4]
+
+    def test_unknown_values(self):
+        car = EVCar(CAR1)
+        hist = VehicleHistory(2)
+        hist.append(car)
+        # batteryLevel starts as "" until the first refresh
+        assert hist.column("batteryLevel") == [None]
+        assert hist.column("chargeMode") == [""]
+
+    def test_kept_across_get_cars(self):
+        page = MyChevy("user", "passwd", history_size=10)
+        account = {"serverErrorMsgs": [],
+                   "data": {"vehicleMap": {"123": CAR1}}}
+        page.account = parse_account(json.dumps(account).encode())
+
+        page.get_cars()
+        page.cars[0].from_json(PKT1)
+        page.get_cars()
+
+        assert page.cars[0].history is page.history["fakevin"]
+        assert len(page.history["fakevin"]) == 1
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `mychevy.metrics` module."""
+
+import unittest
+from unittest import mock
+
+from mychevy.metrics import HistogramCollector
+from mychevy.mychevy import EVCar, MyChevy
+from tests.test_mychevy import CAR1, PKT1
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_render(self):
+        collector = HistogramCollector(buckets=(0.1, 1))
+        collector.observe("evstats", 0.05, 100, 200, 0)
+        collector.observe("evstats", 0.5, 50, 200, 1)
+        collector.observe("evstats", 5, 0, None, 2)
+
+        text = collector.render()
+        bucket = 'mychevy_request_duration_seconds_bucket{phase="evstats",'
+        for line in (
+            bucket + 'le="0.1"} 1',
+            bucket + 'le="1"} 2',
+            bucket + 'le="+Inf"} 3',
+            'mychevy_request_duration_seconds_count{phase="evstats"} 3',
+            'mychevy_response_bytes_total{phase="evstats"} 150',
+            'mychevy_responses_total{phase="evstats",status="200"} 2',
+            'mychevy_responses_total{phase="evstats",status="error"} 1',
+            'mychevy_retried_requests_total{phase="evstats"} 2',
+        ):
+            assert line in text.splitlines()
+
+    def test_fetch_phases_and_retries(self):
+        collector = mock.Mock()
+        page = MyChevy("user", "passwd", metrics=collector)
+        car = EVCar(CAR1)
+        error = b'{"serverErrorMsgs":[],"data":"SERVER ERROR"}'
+        responses = [PKT1, error]
+
+        def get(url, **kwargs):
+            content = b"" if "createAppSessionKey" in url else responses.pop()
+            return mock.Mock(is_redirect=False, status_code=200,
+                             content=content)
+
+        page.session = mock.Mock(get=get)
+        with mock.patch("time.sleep"):
+            page._fetch_car(car)
+
+        calls = [(c[0][0], c[0][2], c[0][4])
+                 for c in collector.observe.call_args_list]
+        assert calls == [
+            ("session_key", 0, 0),
+            ("evstats", len(error), 0),
+            ("session_key", 0, 1),
+            ("evstats", len(PKT1), 1),
+        ]
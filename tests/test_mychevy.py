@@ -3,11 +3,15 @@
 
 """Tests for `mychevy` package."""
 
+import json
+import math
 import unittest
+from unittest import mock
 
 import pytest
 
-from mychevy.mychevy import EVCar, ServerError
+from mychevy.mychevy import EVCar, MyChevy, ServerError, parse_account
+from mychevy.retry import CircuitBreaker, RetryPolicy
 
 CAR1 = {
     "vin": "fakevin",
@@ -19,6 +23,16 @@ CAR1 = {
     "imageUrl": ""
 }
 
+CAR2 = {
+    "vin": "othervin",
+    "vehicle_id": "456",
+    "onstarAccountNumber": "456",
+    "year": "2019",
+    "make": "Chevy",
+    "model": "Volt",
+    "imageUrl": ""
+}
+
 # DATA packet:
 PKT1 = b'{"messages":[],"serverErrorMsgs":[],"data":{"dataAsOfDate":1516671611000,"batteryLevel":70,"chargeState":"not_charging","plugState":"plugged","rateType":"PEAK","voltage":240,"electricRange":132,"totalRange":132,"chargeMode":"DEPARTURE_BASED","electricMiles":1601,"gasMiles":0,"totalMiles":1601,"percentageOnElectric":1,"fuelEconomy":1000,"electricEconomy":45,"combinedEconomy":11,"fuelUsed":132,"electricityUsed":132,"estimatedGallonsFuelSaved":61.13,"estimatedCO2Avoided":1185.92,"estimatedFullChargeBy":"5:00 a.m."}}'  # noqa
 
@@ -46,3 +60,260 @@ class TestMyChevy(unittest.TestCase):
         assert car.totalRange == 132
         assert car.totalMiles == 1601
         assert car.estimatedFullChargeBy == "5:00 a.m."
+
+    def test_update_cars_concurrently(self):
+        page = MyChevy("user", "passwd")
+        page.cars = [EVCar(CAR1), EVCar(CAR2)]
+
+        def fetch(car):
+            if car.vin == "othervin":
+                raise ServerError("boom")
+            car.from_json(PKT1)
+
+        page._fetch_car = fetch
+        errors = page.update_cars_concurrently(max_workers=2)
+
+        assert list(errors) == ["othervin"]
+        assert isinstance(errors["othervin"], ServerError)
+        assert page.cars[0].batteryLevel == 70
+
+    def _fake_vehicle_get(self, page, evstats, sessions=None):
+        calls = []
+
+        def get(url, **kwargs):
+            kind = "session" if "createAppSessionKey" in url else "evstats"
+            calls.append(kind)
+            if calls[-1] == "session":
+                if sessions:
+                    return sessions.pop(0)
+                return mock.Mock(is_redirect=False, status_code=200,
+                                 content=b"")
+            return evstats.pop(0)
+
+        page.session = mock.Mock(get=get)
+        return calls
+
+    def test_app_session_reused(self):
+        page = MyChevy("user", "passwd")
+        car = EVCar(CAR1)
+        ok = mock.Mock(is_redirect=False, status_code=200, content=PKT1)
+        calls = self._fake_vehicle_get(page, [ok, ok])
+
+        page._fetch_car(car)
+        page._fetch_car(car)
+
+        assert calls == ["session", "evstats", "evstats"]
+
+    def test_app_session_renewed(self):
+        page = MyChevy("user", "passwd")
+        car = EVCar(CAR1)
+        ok = mock.Mock(is_redirect=False, status_code=200, content=PKT1)
+        denied = mock.Mock(is_redirect=False, status_code=401, content=b"")
+        calls = self._fake_vehicle_get(page, [ok, denied, ok])
+
+        page._fetch_car(car)
+        page._fetch_car(car)
+
+        assert calls == ["session", "evstats", "evstats",
+                         "session", "evstats"]
+
+    def test_app_session_failure_not_cached(self):
+        page = MyChevy("user", "passwd", retry_policy=RetryPolicy(tries=1),
+                       breaker=CircuitBreaker())
+        car = EVCar(CAR1)
+        ok = mock.Mock(is_redirect=False, status_code=200, content=PKT1)
+        down = mock.Mock(is_redirect=False, status_code=503, content=b"")
+        moved = mock.Mock(is_redirect=True, status_code=302, content=b"")
+        calls = self._fake_vehicle_get(page, [ok, ok], [down, moved])
+
+        with pytest.raises(ServerError):
+            page._fetch_car(car)
+        assert car.vin not in page._app_sessions
+        page._fetch_car(car)
+        assert car.vin not in page._app_sessions
+        page._fetch_car(car)
+
+        assert calls == ["session", "session", "evstats",
+                         "session", "evstats"]
+
+    def test_app_session_expired(self):
+        page = MyChevy("user", "passwd", app_session_ttl=-1)
+        car = EVCar(CAR1)
+        ok = mock.Mock(is_redirect=False, status_code=200, content=PKT1)
+        calls = self._fake_vehicle_get(page, [ok, ok])
+
+        page._fetch_car(car)
+        page._fetch_car(car)
+
+        assert calls == ["session", "evstats", "session", "evstats"]
+
+    def test_failed_relogin_shared(self):
+        page = MyChevy("user", "passwd")
+        error = ServerError("login down")
+        page.login = mock.Mock(side_effect=error)
+        generation = page._login_generation
+
+        with pytest.raises(ServerError) as e:
+            page._relogin(generation)
+        assert e.value is error
+        # a caller that was waiting on the same expired session gets
+        # the error, rather than trying again
+        with pytest.raises(ServerError) as e:
+            page._relogin(generation)
+        assert e.value is error
+        assert page.login.call_count == 1
+
+        # a later expiry does try again
+        page.login.side_effect = None
+        page._relogin(page._login_generation)
+        assert page.login.call_count == 2
+
+    def test_data_as_of_date(self):
+        car = EVCar(CAR1)
+        assert car.dataAsOfDate is None
+        assert car.age is None
+
+        assert car.from_json(PKT1) is True
+        assert car.dataAsOfDate == 1516671611000
+        assert car.is_fresh(60)
+
+        # same snapshot again is not new data
+        assert car.from_json(PKT1) is False
+
+    def test_update_cars_max_age(self):
+        page = MyChevy("user", "passwd")
+        page.cars = [EVCar(CAR1), EVCar(CAR2)]
+        page.cars[0].from_json(PKT1)
+        fetched = []
+        page._fetch_car = fetched.append
+
+        page.update_cars(max_age=60)
+        assert fetched == [page.cars[1]]
+
+        page.update_cars_concurrently(max_age=60)
+        assert fetched == [page.cars[1], page.cars[1]]
+
+    def test_slots(self):
+        car = EVCar(CAR1)
+        with pytest.raises(AttributeError):
+            car.not_an_attribute = 1
+
+        car.update(batteryLevel=50, plugged_in=True)
+        assert car.batteryLevel == 50
+        with pytest.raises(KeyError):
+            car.update(name="nope")
+
+    def test_snapshot(self):
+        page = MyChevy("user", "passwd")
+        page.cars = [EVCar(CAR1), EVCar(CAR2)]
+        page.cars[0].from_json(PKT1)
+
+        snap = page.snapshot()
+        assert snap["vin"] == ["fakevin", "othervin"]
+        assert snap["chargeState"] == ["not_charging", ""]
+        assert snap["batteryLevel"][0] == 70
+        assert math.isnan(snap["batteryLevel"][1])
+        assert list(snap["totalMiles"]) == [1601, 0]
+        assert snap["dataAsOfDate"][0] == 1516671611000
+
+    def test_json_decode_failure(self):
+        car = EVCar(CAR1)
+        assert car.from_json(b'<html>login</html>') is False
+        assert car.last_update is None
+
+    def test_transport_settings(self):
+        page = MyChevy("user", "passwd", pool_maxsize=16, keep_alive=False)
+        session = page._new_session()
+        assert session.get_adapter("https://my.chevrolet.com/") is \
+            page.adapter
+        assert page.adapter._pool_maxsize == 16
+        assert session.headers["Connection"] == "close"
+
+        # the adapter, and so its pooled connections, survive a re-login
+        assert page._new_session().get_adapter(
+            "https://custlogin.gm.com/") is page.adapter
+
+    def _account(self, *cars):
+        vehicles = {c["vehicle_id"]: c for c in cars}
+        account = {"serverErrorMsgs": [], "data": {"vehicleMap": vehicles}}
+        return parse_account(json.dumps(account).encode())
+
+    def test_parse_account(self):
+        account = self._account(dict(CAR1, extra="x" * 1000))
+        assert account.vehicles == (CAR1,)
+
+        with pytest.raises(ServerError):
+            parse_account(b'{"serverErrorMsgs":["boom"],"data":{}}')
+        with pytest.raises(ValueError) as e:
+            parse_account(b"<html>" + b"x" * 10000 + b"</html>")
+        assert len(str(e.value)) < 200
+
+        page = MyChevy("user", "passwd")
+        with pytest.raises(ValueError):
+            page.get_cars()
+
+    def test_subscribe(self):
+        page = MyChevy("user", "passwd")
+        events = []
+        page.subscribe(events.append)
+        page.account = self._account(CAR1)
+        page.get_cars()
+        car = page.cars[0]
+
+        car.from_json(PKT1)
+        assert len(events) == 1
+        event = events[0]
+        assert event.car is car
+        assert event.dataAsOfDate == 1516671611000
+        assert event.changes["batteryLevel"] == ("", 70)
+        assert event.changes["plugged_in"] == (False, True)
+        assert "gasMiles" not in event.changes
+
+        # nothing changed, nothing fired
+        car.from_json(PKT1)
+        assert len(events) == 1
+
+        car.from_json(PKT1.replace(b'"batteryLevel":70',
+                                   b'"batteryLevel":71'))
+        assert events[1].changes == {"batteryLevel": (70, 71)}
+
+        # a failing subscriber doesn't break the refresh or the others
+        car.subscribe(lambda event: 1 / 0)
+        page.unsubscribe(events.append)
+        car.subscribe(events.append)
+        car.from_json(PKT1)
+        assert len(events) == 3
+
+    def test_car_registry(self):
+        page = MyChevy("user", "passwd")
+        page.account = self._account(CAR1, CAR2)
+        page.get_cars()
+        car = page.get_car("fakevin")
+        assert car.vid == "123"
+        assert page.get_car_by_id("456").vin == "othervin"
+        assert page.get_car("nope") is None
+
+        # get_cars keeps existing cars, and drops ones that went away
+        car.from_json(PKT1)
+        page.account = self._account(dict(CAR1, model="Bolt EUV"))
+        page.get_cars()
+        assert page.cars == [car]
+        assert car.model == "Bolt EUV"
+        assert car.batteryLevel == 70
+        assert page.get_car("othervin") is None
+
+    def test_update_car(self):
+        page = MyChevy("user", "passwd")
+        page.account = self._account(CAR1, CAR2)
+        page.get_cars()
+        fetched = []
+        page._fetch_car = fetched.append
+
+        assert page.update_car("othervin").vin == "othervin"
+        assert [c.vin for c in fetched] == ["othervin"]
+        with pytest.raises(KeyError):
+            page.update_car("nope")
+
+        page.get_car("fakevin").from_json(PKT1)
+        page.update_car("fakevin", max_age=60)
+        assert len(fetched) == 1
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `mychevy.ratelimit` module."""
+
+import unittest
+from unittest import mock
+
+from mychevy.mychevy import MyChevy
+from mychevy.ratelimit import DEFAULT_LIMITER, RateLimiter, TokenBucket
+from tests.fakegm import FakeGM
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRateLimit(unittest.TestCase):
+
+    def test_bucket_schedules_ahead(self):
+        clock = FakeClock()
+        bucket = TokenBucket(2, burst=2, clock=clock)
+        assert [bucket.reserve() for _ in range(5)] == [0, 0, 0.5, 1.0, 1.5]
+
+        # after 3 seconds the debt is paid and the bucket is full again
+        clock.now = 3
+        assert [bucket.reserve() for _ in range(3)] == [0, 0, 0.5]
+
+    def test_per_host(self):
+        clock = FakeClock()
+        limiter = RateLimiter(clock=clock)
+        limiter.configure(per_host={"custlogin.gm.com": 1,
+                                    "my.chevrolet.com": (10, 5)})
+
+        login = "https://custlogin.gm.com/SelfAsserted"
+        evstats = "https://my.chevrolet.com/api/vehicleProfile/x/evstats"
+        assert limiter.delay(login) == 0
+        assert limiter.delay(login) == 1
+        assert [limiter.delay(evstats) for _ in range(5)] == [0] * 5
+        assert limiter.delay("https://example.com/") == 0
+
+    def test_global_and_host(self):
+        clock = FakeClock()
+        limiter = RateLimiter(clock=clock)
+        limiter.configure(rate=1, burst=1,
+                          per_host={"custlogin.gm.com": 0.5})
+
+        assert limiter.delay("https://custlogin.gm.com/") == 0
+        # the longer of the two waits wins
+        assert limiter.delay("https://custlogin.gm.com/") == 2
+        assert limiter.delay("https://my.chevrolet.com/") == 2
+
+    def test_per_endpoint(self):
+        clock = FakeClock()
+        limiter = RateLimiter(clock=clock)
+        limiter.configure(per_endpoint={"login": 1, "vehicle": (10, 5)})
+
+        # same host, limited apart
+        login = "https://my.chevrolet.com/api/init/loginSuccessData"
+        evstats = "https://my.chevrolet.com/api/vehicleProfile/x/evstats"
+        assert limiter.delay(login, "login_success") == 0
+        assert limiter.delay(login, "login_success") == 1
+        assert [limiter.delay(evstats, "evstats")
+                for _ in range(5)] == [0] * 5
+        assert limiter.delay(evstats, "evstats") == 0.1
+        assert limiter.delay(login, "oc_login") == 2
+        assert limiter.delay(login) == 0
+
+    def test_redirects_limited(self):
+        limiter = RateLimiter()
+        with FakeGM() as gm:
+            page = MyChevy("user", "passwd", urls=gm.urls,
+                           rate_limiter=limiter)
+            with mock.patch.object(limiter, "delay",
+                                   wraps=limiter.delay) as delay:
+                page.login()
+        urls = [c[0][0] for c in delay.call_args_list]
+        # /home redirects to /authorize, which waited for the limiter
+        assert gm.base + "/home" in urls
+        authorize = [c for c in delay.call_args_list
+                     if "/authorize" in c[0][0]]
+        assert [c[0][1] for c in authorize] == ["home"]
+
+    @mock.patch("time.sleep")
+    def test_mychevy_shares_default(self, sleep):
+        assert MyChevy("a", "b").rate_limiter is DEFAULT_LIMITER
+
+        limiter = RateLimiter()
+        limiter.configure(rate=1)
+        page = MyChevy("user", "passwd", rate_limiter=limiter)
+        page.session = mock.Mock()
+        page.session.get.return_value = mock.Mock(
+            is_redirect=False, content=b"", status_code=200)
+        page._request("home", "get", "https://my.chevrolet.com/home")
+        page._request("home", "get", "https://my.chevrolet.com/home")
+        assert sleep.call_count == 1
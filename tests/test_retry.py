@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `mychevy.retry` module."""
+
+import unittest
+from unittest import mock
+
+import pytest
+import requests
+
+from mychevy.mychevy import (
+    CircuitOpenError,
+    EVCar,
+    MyChevy,
+    ServerError,
+    VehicleError,
+)
+from mychevy.retry import CircuitBreaker, RetryBudget, RetryPolicy
+from tests.test_mychevy import CAR1
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRetry(unittest.TestCase):
+
+    def test_policy_delays(self):
+        policy = RetryPolicy(delay=3, backoff=2, max_delay=10, jitter=False)
+        assert [policy.delay_for(n) for n in (1, 2, 3)] == [3, 6, 10]
+
+        policy.jitter = True
+        for _ in range(20):
+            assert 1.5 <= policy.delay_for(1) <= 3
+
+    def test_budget(self):
+        clock = FakeClock()
+        budget = RetryBudget(2, window=10, clock=clock)
+        assert budget.acquire()
+        assert budget.acquire()
+        assert not budget.acquire()
+        clock.now = 10
+        assert budget.acquire()
+
+    def test_breaker(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(threshold=2, reset=30, clock=clock)
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.is_open
+        assert not breaker.allow()
+
+        # one trial call after the reset time, failure opens it again
+        clock.now = 30
+        assert breaker.allow()
+        assert not breaker.allow()
+        breaker.record_failure()
+        assert not breaker.allow()
+
+        clock.now = 60
+        assert breaker.allow()
+        breaker.record_success()
+        assert not breaker.is_open
+        assert breaker.allow()
+
+    def _page(self, **kwargs):
+        kwargs.setdefault("breaker", CircuitBreaker())
+        page = MyChevy("user", "passwd", **kwargs)
+        page._fetch_car_once = mock.Mock()
+        return page
+
+    @mock.patch("time.sleep")
+    def test_transport_errors_retried(self, sleep):
+        page = self._page()
+        page._fetch_car_once.side_effect = [
+            requests.ConnectionError("reset"), requests.Timeout("slow"), None]
+
+        page._fetch_car(EVCar(CAR1))
+        assert page._fetch_car_once.call_count == 3
+        assert sleep.call_count == 2
+
+    @mock.patch("time.sleep")
+    def test_5xx_is_server_error(self, sleep):
+        page = MyChevy("user", "passwd", breaker=CircuitBreaker())
+        page._app_sessions["fakevin"] = float("inf")
+        page.session = mock.Mock()
+        page.session.get.return_value = mock.Mock(
+            is_redirect=False, status_code=503, content=b"")
+
+        with pytest.raises(ServerError):
+            page._fetch_car(EVCar(CAR1))
+        assert sleep.call_count == 2
+
+    @mock.patch("time.sleep")
+    def test_budget_stops_retries(self, sleep):
+        page = self._page(retry_budget=RetryBudget(1))
+        page._fetch_car_once.side_effect = ServerError("down")
+
+        with pytest.raises(ServerError):
+            page._fetch_car(EVCar(CAR1))
+        assert page._fetch_car_once.call_count == 2
+
+    @mock.patch("time.sleep")
+    def test_open_breaker_fails_fast(self, sleep):
+        page = self._page(breaker=CircuitBreaker(threshold=2))
+        page._fetch_car_once.side_effect = ServerError("down")
+
+        # a failure is counted per call, not per attempt
+        for _ in range(2):
+            with pytest.raises(ServerError):
+                page._fetch_car(EVCar(CAR1))
+        assert page._fetch_car_once.call_count == 6
+        assert page.breaker.is_open
+
+        with pytest.raises(CircuitOpenError):
+            page._fetch_car(EVCar(CAR1))
+        assert page._fetch_car_once.call_count == 6
+
+    def test_offline_cars_and_breaker(self):
+        page = self._page(breaker=CircuitBreaker(threshold=2),
+                          retry_policy=RetryPolicy(tries=1))
+        offline = VehicleError("SERVER ERROR")
+        page._fetch_car_once.side_effect = [offline, None, offline, None]
+
+        # an offline car now and then doesn't open the breaker
+        for _ in range(2):
+            with pytest.raises(VehicleError):
+                page._fetch_car(EVCar(CAR1))
+            page._fetch_car(EVCar(CAR1))
+        assert not page.breaker.is_open
+
+        # but OnStar answering that for every car does
+        page._fetch_car_once.side_effect = offline
+        for _ in range(2):
+            with pytest.raises(VehicleError):
+                page._fetch_car(EVCar(CAR1))
+        assert page.breaker.is_open
+
+    def test_other_errors_end_breaker_trial(self):
+        clock = FakeClock()
+        page = self._page(
+            breaker=CircuitBreaker(threshold=1, reset=30, clock=clock),
+            retry_policy=RetryPolicy(tries=1),
+        )
+        page._fetch_car_once.side_effect = [
+            ServerError("down"), KeyError("vin"), None]
+
+        with pytest.raises(ServerError):
+            page._fetch_car(EVCar(CAR1))
+        clock.now = 30
+        with pytest.raises(KeyError):
+            page._fetch_car(EVCar(CAR1))
+        assert page.breaker.is_open
+
+        # the trial ended, so the next one is let through
+        page._fetch_car(EVCar(CAR1))
+        assert not page.breaker.is_open
+
+    @mock.patch("time.sleep")
+    def test_budgets_spent_together(self, sleep):
+        account = RetryBudget(5)
+        page = self._page(retry_budget=account)
+        page.retry_budgets = (account, RetryBudget(0))
+        page._fetch_car_once.side_effect = ServerError("down")
+
+        with pytest.raises(ServerError):
+            page._fetch_car(EVCar(CAR1))
+        assert page._fetch_car_once.call_count == 1
+        # the global budget refused, so the account's wasn't spent
+        assert len(account._spent) == 0
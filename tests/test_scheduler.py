@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `mychevy.scheduler` module."""
+
+import datetime
+import unittest
+
+from mychevy.mychevy import EVCar, MyChevy
+from mychevy.scheduler import (
+    CHARGING_INTERVAL,
+    PLUGGED_INTERVAL,
+    UNPLUGGED_INTERVAL,
+    PollScheduler,
+    parse_full_charge_by,
+)
+from tests.test_mychevy import CAR1, CAR2
+
+# 2018-01-22 03:00 local time
+NOW = datetime.datetime(2018, 1, 22, 3, 0).timestamp()
+
+
+class TestScheduler(unittest.TestCase):
+
+    def test_parse_full_charge_by(self):
+        eta = parse_full_charge_by("5:00 a.m.", NOW)
+        assert eta - NOW == 2 * 60 * 60
+        eta = parse_full_charge_by("1:30 a.m.", NOW)
+        assert eta - NOW == 22.5 * 60 * 60
+        assert parse_full_charge_by("", NOW) is None
+        assert parse_full_charge_by("soon", NOW) is None
+
+    def test_next_interval(self):
+        sched = PollScheduler(MyChevy("user", "passwd"))
+        car = EVCar(CAR1)
+        assert sched.next_interval(car, NOW) == UNPLUGGED_INTERVAL
+
+        car.plugged_in = True
+        assert sched.next_interval(car, NOW) == PLUGGED_INTERVAL
+
+        car.chargeState = "charging"
+        car.estimatedFullChargeBy = "5:00 a.m."
+        assert sched.next_interval(car, NOW) == CHARGING_INTERVAL
+
+        car.estimatedFullChargeBy = "3:02 a.m."
+        assert sched.next_interval(car, NOW) == 3 * 60
+
+    def test_run_pending(self):
+        now = [NOW]
+        page = MyChevy("user", "passwd")
+        page.cars = [EVCar(CAR1), EVCar(CAR2)]
+        page.cars[1].plugged_in = True
+        fetched = []
+        page._fetch_car = fetched.append
+        sched = PollScheduler(page, clock=lambda: now[0])
+
+        assert sched.run_pending() == page.cars
+        assert sched.run_pending() == []
+
+        now[0] += PLUGGED_INTERVAL
+        assert sched.run_pending() == [page.cars[1]]
+        assert sched.next_due() == NOW + 2 * PLUGGED_INTERVAL
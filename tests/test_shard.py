@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `mychevy.shard` module."""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mychevy.cache import SessionStore
+from mychevy.shard import ShardedFleet, shard_cache_path, shard_for
+from tests.fakegm import FakeGM
+
+
+class TestShard(unittest.TestCase):
+
+    def test_shard_for(self):
+        assert shard_for("one@example.com", 4) == shard_for(
+            "ONE@example.com", 4)
+        shards = {shard_for("user%d@example.com" % i, 4) for i in range(50)}
+        assert shards == {0, 1, 2, 3}
+
+    def test_refresh(self):
+        with FakeGM(vehicles=2) as gm:
+            fleet = ShardedFleet(shards=2, max_workers=2)
+            users = ["user%d@example.com" % i for i in range(4)]
+            for user in users:
+                fleet.add_account(user, "secret", urls=gm.urls)
+            with fleet:
+                results = fleet.refresh_all(timeout=30)
+                assert len(results) == 8
+                assert all(r.error is None for r in results)
+                assert {r.user for r in results} == set(users)
+                for r in results:
+                    assert r.shard == shard_for(r.user, 2)
+                    assert r.car["vin"] == r.vin
+                    assert r.car["batteryLevel"] is not None
+
+                # sessions stay warm in the workers
+                logins = gm.requests["/oc_login"]
+                assert len(fleet.refresh_all(timeout=30)) == 8
+                assert gm.requests["/oc_login"] == logins == 4
+
+    def test_dead_worker(self):
+        with FakeGM(vehicles=1) as gm:
+            fleet = ShardedFleet(shards=2)
+            users = ["user%d@example.com" % i for i in range(4)]
+            for user in users:
+                fleet.add_account(user, "secret", urls=gm.urls)
+            with fleet:
+                p = fleet._processes[0]
+                p.kill()
+                p.join()
+
+                results = fleet.refresh_all(timeout=30)
+                errors = [r for r in results if r.error is not None]
+                assert len(errors) == 1
+                assert errors[0].shard == 0
+                assert errors[0].user is None
+                assert "died" in errors[0].error
+                live = [u for u in users if shard_for(u, 2) == 1]
+                assert {r.user for r in results if r.error is None} == set(
+                    live)
+
+                # the worker was restarted
+                results = fleet.refresh_all(timeout=30)
+                assert len(results) == 4
+                assert all(r.error is None for r in results)
+
+    def test_session_cache(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, "sessions.json")
+        with self.assertRaises(TypeError):
+            ShardedFleet(shards=2, session_store=SessionStore(path))
+
+        users = ["user%d@example.com" % i for i in range(4)]
+        with FakeGM() as gm:
+            for _ in range(2):
+                fleet = ShardedFleet(shards=2, session_cache=path)
+                for user in users:
+                    fleet.add_account(user, "secret", urls=gm.urls)
+                with fleet:
+                    results = fleet.refresh_all(timeout=30)
+                    assert all(r.error is None for r in results)
+            # the second fleet resumed every saved session
+            assert gm.requests["/oc_login"] == 4
+
+        # one file per shard, each with just that shard's accounts
+        for shard in range(2):
+            with open(shard_cache_path(path, shard)) as f:
+                assert len(json.load(f)) == 2
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `mychevy.singleflight` module."""
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import unittest
+
+import pytest
+
+from mychevy.mychevy import EVCar, MyChevy
+from mychevy.singleflight import SingleFlight
+from tests.fakegm import FakeGM, vehicle
+
+
+def wait_for(predicate):
+    for _ in range(1000):
+        if predicate():
+            return
+        time.sleep(0.001)
+    raise AssertionError("timed out")
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_shared_result(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def slow(value):
+            calls.append(value)
+            release.wait()
+            return value * 2
+
+        with ThreadPoolExecutor(5) as pool:
+            first = pool.submit(flight.do, "car", slow, 21)
+            wait_for(lambda: calls)
+            rest = [pool.submit(flight.do, "car", slow, 0) for _ in range(3)]
+            other = pool.submit(flight.do, "other", lambda: "other")
+            assert other.result() == "other"
+            wait_for(lambda: flight._calls["car"].shared == 3)
+            release.set()
+            results = [f.result() for f in [first] + rest]
+
+        assert results == [42] * 4
+        assert calls == [21]
+        assert flight.in_flight() == []
+
+    def test_shared_error(self):
+        flight = SingleFlight()
+        release = threading.Event()
+
+        def boom():
+            release.wait()
+            raise ValueError("boom")
+
+        with ThreadPoolExecutor(2) as pool:
+            first = pool.submit(flight.do, "car", boom)
+            wait_for(lambda: flight.in_flight())
+            second = pool.submit(flight.do, "car", boom)
+            wait_for(lambda: flight._calls["car"].shared == 1)
+            release.set()
+            for f in (first, second):
+                with pytest.raises(ValueError):
+                    f.result()
+
+    def test_concurrent_fetches_coalesced(self):
+        gm = FakeGM(latency=0.05).start()
+        self.addCleanup(gm.stop)
+        page = MyChevy("me@example.com", "secret", urls=gm.urls)
+        page.login()
+        car = EVCar(vehicle(0))
+
+        with ThreadPoolExecutor(5) as pool:
+            for f in [pool.submit(page._fetch_car, car) for _ in range(5)]:
+                f.result()
+
+        assert gm.requests["evstats"] == 1
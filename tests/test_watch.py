@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `mychevy.watch` module."""
+
+import io
+import json
+import threading
+import time
+import unittest
+
+from mychevy.mychevy import EVCar, MyChevy, ServerError
+from mychevy.watch import JsonLinesWriter, watch
+from tests.test_mychevy import CAR1, CAR2, PKT1
+
+
+class SlowFile(io.StringIO):
+    def __init__(self):
+        super(SlowFile, self).__init__()
+        self.gate = threading.Event()
+
+    def write(self, s):
+        self.gate.wait()
+        return super(SlowFile, self).write(s)
+
+
+class ClosedPipe(io.StringIO):
+    def write(self, s):
+        raise BrokenPipeError(32, "Broken pipe")
+
+
+class TestWatch(unittest.TestCase):
+
+    def test_watch(self):
+        page = MyChevy("user", "passwd")
+        page.cars = [EVCar(CAR1), EVCar(CAR2)]
+
+        def fetch(car):
+            if car.vin == "othervin":
+                raise ServerError("boom")
+            car.from_json(PKT1)
+
+        page._fetch_car = fetch
+        out = io.StringIO()
+        writer = JsonLinesWriter(out)
+        watch(page, writer, interval=0, count=2)
+        writer.close()
+
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        assert len(records) == 4
+        assert records[0]["vin"] == "fakevin"
+        assert records[0]["batteryLevel"] == 70
+        assert records[0]["dataAsOfDate"] == 1516671611000
+        assert records[1] == {"vin": "othervin", "error": "boom",
+                              "timestamp": records[1]["timestamp"]}
+
+    def test_bounded_buffer(self):
+        out = SlowFile()
+        writer = JsonLinesWriter(out, buffer_size=2)
+        writer.put({"n": 0})
+        # wait for the writer thread to pick up the first record
+        while writer._buffer:
+            time.sleep(0.001)
+        for n in range(1, 5):
+            writer.put({"n": n})
+        out.gate.set()
+        writer.close()
+
+        assert writer.dropped == 2
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        assert lines == [{"n": 0}, {"n": 3}, {"n": 4}]
+
+    def test_write_error_stops_watch(self):
+        page = MyChevy("user", "passwd")
+        page.cars = [EVCar(CAR1)]
+        page._fetch_car = lambda car: car.from_json(PKT1)
+        writer = JsonLinesWriter(ClosedPipe())
+
+        with self.assertRaises(BrokenPipeError):
+            watch(page, writer, interval=0.01)
+        assert not writer._thread.is_alive()
+        # already reported, so close() doesn't raise it again
+        writer.close()
+
+    def test_write_error_raised_on_close(self):
+        writer = JsonLinesWriter(ClosedPipe())
+        writer.put({"n": 0})
+        with self.assertRaises(BrokenPipeError):
+            writer.close()